@@ -8,6 +8,9 @@ from PIL import Image
 from io import BytesIO
 import base64
 
+from backups import start_backup_scheduler
+from safe_io import atomic_write, file_lock, update_csv, write_csv, write_json
+
 # Constants
 DATA_DIR = "data"
 CANDIDATES_FILE = os.path.join(DATA_DIR, "candidates.csv")
@@ -16,6 +19,15 @@ QR_CODE_FILE = os.path.join(DATA_DIR, "qr_code.png")
 LOGO_FILE = "logo1.png"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Candidates and their CVs are snapshotted by content hash in the background
+BACKUP_DIR = os.path.join(DATA_DIR, "application_backups")
+BACKUP_INTERVAL = 15 * 60
+BACKUP_KEEP = 96
+BACKUP_SOURCES = {
+    "candidates": CANDIDATES_FILE,
+    "cvs": os.path.join(DATA_DIR, "cv_*"),
+}
+
 # Department descriptions and requirements
 DEPARTMENT_INFO = {
     "ICT": {
@@ -55,7 +67,8 @@ def generate_qr_code():
     qr.add_data("https://mock-interview-talent.streamlit.app/")
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
-    img.save(QR_CODE_FILE)
+    with atomic_write(QR_CODE_FILE, "wb") as f:
+        img.save(f)
 
 def show_qr_code():
     """Display QR code for application"""
@@ -78,15 +91,17 @@ def display_logo():
 
 def initialize_files():
     """Initialize data files and generate QR code if needed"""
-    if not os.path.exists(CANDIDATES_FILE):
-        pd.DataFrame(columns=[
-            'timestamp', 'username', 'first_name', 'last_name', 'email', 'phone', 
-            'department', 'position', 'cv_filename', 'status', 'room', 'notes'
-        ]).to_csv(CANDIDATES_FILE, index=False)
+    # Locked so two workers starting together cannot both create a file
+    with file_lock(CANDIDATES_FILE):
+        if not os.path.exists(CANDIDATES_FILE):
+            write_csv(CANDIDATES_FILE, pd.DataFrame(columns=[
+                'timestamp', 'username', 'first_name', 'last_name', 'email', 'phone', 
+                'department', 'position', 'cv_filename', 'status', 'room', 'notes'
+            ]))
     
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            json.dump({
+    with file_lock(USERS_FILE):
+        if not os.path.exists(USERS_FILE):
+            write_json(USERS_FILE, {
                 "admin": {
                     "password": "Mockk2@2025",
                     "role": "candidate"
@@ -99,11 +114,13 @@ def initialize_files():
                     "password": "Mock2@2025",
                     "role": "candidate"
                 }
-            }, f)
+            })
 
     if not os.path.exists(QR_CODE_FILE):
         generate_qr_code()
 
+    start_backup_scheduler(None, BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, media=BACKUP_SOURCES)
+
 def set_custom_styles():
     """Set custom CSS styles for the entire application including dark mode support."""
     st.markdown("""
@@ -419,7 +436,7 @@ def candidate_application():
                     cv_filename = f"cv_{first_name}_{last_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{cv_file.name.split('.')[-1]}"
                     cv_path = os.path.join(DATA_DIR, cv_filename)
                     
-                    with open(cv_path, "wb") as f:
+                    with atomic_write(cv_path, "wb") as f:
                         f.write(cv_file.getbuffer())
                     
                     # Save application
@@ -438,9 +455,11 @@ def candidate_application():
                         'notes': ''
                     }
                     
-                    df = pd.read_csv(CANDIDATES_FILE)
-                    df = pd.concat([df, pd.DataFrame([new_application])], ignore_index=True)
-                    df.to_csv(CANDIDATES_FILE, index=False)
+                    # Locked read-modify-write so concurrent applications are not lost
+                    update_csv(
+                        CANDIDATES_FILE,
+                        lambda df: pd.concat([df, pd.DataFrame([new_application])], ignore_index=True)
+                    )
                     
                     st.success("Application submitted successfully!")
                     st.balloons()
@@ -484,6 +503,12 @@ def display_cv(cv_path):
     except Exception as e:
         st.error(f"Error displaying CV: {str(e)}")
 
+def set_application_fields(df: pd.DataFrame, timestamp: str, **fields) -> pd.DataFrame:
+    """Set fields on the application submitted at ``timestamp``"""
+    for column, value in fields.items():
+        df.loc[df['timestamp'] == timestamp, column] = value
+    return df
+
 def facilitator_dashboard():
     """Enhanced facilitator dashboard with delete functionality"""
     st.title("Facilitator Dashboard")
@@ -577,9 +602,10 @@ def facilitator_dashboard():
                         with col1:
                             if st.form_submit_button("Update"):
                                 try:
-                                    df.loc[df['timestamp'] == row['timestamp'], 'status'] = new_status
-                                    df.loc[df['timestamp'] == row['timestamp'], 'notes'] = notes
-                                    df.to_csv(CANDIDATES_FILE, index=False)
+                                    # Update the full file, not just the filtered view shown here
+                                    update_csv(CANDIDATES_FILE, lambda all_df: set_application_fields(
+                                        all_df, row['timestamp'], status=new_status, notes=notes
+                                    ))
                                     st.success("Application updated successfully!")
                                     st.rerun()
                                 except Exception as e:
@@ -591,9 +617,8 @@ def facilitator_dashboard():
                                     if os.path.exists(cv_path):
                                         os.remove(cv_path)
                                     
-                                    # Remove the application from the dataframe
-                                    df = df[df['timestamp'] != row['timestamp']]
-                                    df.to_csv(CANDIDATES_FILE, index=False)
+                                    # Remove the application from the full file
+                                    update_csv(CANDIDATES_FILE, lambda all_df: all_df[all_df['timestamp'] != row['timestamp']])
                                     st.success("Application deleted successfully!")
                                     st.rerun()
                                 except Exception as e:
@@ -697,9 +722,8 @@ def admin_dashboard():
                                 if os.path.exists(cv_path):
                                     os.remove(cv_path)
                                 
-                                # Remove the application from the dataframe
-                                df = df[df['timestamp'] != row['timestamp']]
-                                df.to_csv(CANDIDATES_FILE, index=False)
+                                # Remove the application from the full file
+                                update_csv(CANDIDATES_FILE, lambda all_df: all_df[all_df['timestamp'] != row['timestamp']])
                                 st.success("Application deleted successfully!")
                                 st.rerun()
                             except Exception as e:
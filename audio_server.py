@@ -0,0 +1,277 @@
+"""Streaming HTTP endpoint for feedback recordings
+
+Handing ``st.audio`` the bytes of a recording sends the whole file over
+the websocket on every render. Instead, a small threaded HTTP server
+serves the audio directory with byte-range support (browsers seek and
+buffer with ``Range`` requests) and ETag / Cache-Control headers, and the
+dashboard embeds a URL to it. URLs are signed with an HMAC over the file
+name and an expiry time, so recordings are not reachable without a link
+from a logged-in page. The signing key is kept in a file so every
+Streamlit process issues URLs that the one process holding the port
+accepts.
+"""
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+from email.utils import formatdate
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from urllib.request import urlopen
+
+from audio_store import audio_mime_type
+from safe_io import atomic_write, file_lock
+
+# Signed URLs stay valid this long; expiry times are rounded up to a whole
+# period so a page rerendered within it embeds the same, cacheable URL
+URL_TTL = 60 * 60
+
+BLOCK_SIZE = 64 * 1024
+
+KEY_PERMISSIONS = 0o600
+
+# A port held by something other than a peer is tried again this often (seconds)
+PEER_RETRY_INTERVAL = 60
+PEER_TIMEOUT = 2.0
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _load_key(key_path: str) -> bytes:
+    """Read the signing key, creating it on first use
+
+    Anyone who can read the key can forge URLs, so it is only accessible
+    to the user the app runs as; keys written world-readable by earlier
+    versions are replaced (Windows has no such mode bits to check).
+    """
+    with file_lock(key_path):
+        if (not os.path.exists(key_path) or os.path.getsize(key_path) == 0
+                or (os.name == "posix" and os.stat(key_path).st_mode & 0o077)):
+            with atomic_write(key_path, permissions=KEY_PERMISSIONS) as f:
+                f.write(secrets.token_hex(32))
+        with open(key_path) as f:
+            return bytes.fromhex(f.read().strip())
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """``(start, end)`` inclusive for a single-range header, None for the whole file
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        # Missing, malformed or multi-range headers get the whole file
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+class AudioServer:
+    """Serves one audio directory over HTTP and signs URLs into it"""
+
+    def __init__(self, audio_dir: str, port: int, key_path: str, public_url: Optional[str] = None):
+        self.audio_dir = os.path.abspath(audio_dir)
+        self.port = port
+        self.public_url = (public_url or f"http://localhost:{port}").rstrip("/")
+        self._key = _load_key(key_path)
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def _signature(self, name: str, expires: int) -> str:
+        return hmac.new(self._key, f"{name}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def url_for(self, path: str) -> Optional[str]:
+        """Signed URL for a recording in the audio directory, or None for other paths"""
+        if os.path.dirname(os.path.abspath(path)) != self.audio_dir:
+            return None
+        name = os.path.basename(path)
+        expires = (int(time.time()) // URL_TTL + 2) * URL_TTL
+        return f"{self.public_url}/audio/{quote(name)}?expires={expires}&sig={self._signature(name, expires)}"
+
+    def verify(self, name: str, expires: str, signature: str) -> bool:
+        """Whether a URL's signature matches and it has not expired"""
+        try:
+            expires_at = int(expires)
+        except ValueError:
+            return False
+        return expires_at >= time.time() and hmac.compare_digest(self._signature(name, expires_at), signature)
+
+    def _challenge_response(self, challenge: str) -> str:
+        return hmac.new(self._key, f"ping:{challenge}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def peer_accepts_key(self) -> bool:
+        """Whether the port is held by another process serving with this key
+
+        The peer has to answer a random challenge with its HMAC, so an
+        unrelated program on the port is never handed signed URLs.
+        """
+        challenge = secrets.token_hex(16)
+        try:
+            with urlopen(f"http://127.0.0.1:{self.port}/ping?challenge={challenge}", timeout=PEER_TIMEOUT) as response:
+                answer = response.read(128).decode("ascii", "replace")
+        except (OSError, ValueError):
+            return False
+        return hmac.compare_digest(answer, self._challenge_response(challenge))
+
+    def start(self) -> bool:
+        """Bind the port and serve in a daemon thread
+
+        Returns False if the port is already taken, which is expected when
+        another Streamlit process on this host is serving the directory.
+        """
+        try:
+            self._httpd = ThreadingHTTPServer(("", self.port), _AudioRequestHandler)
+        except OSError as e:
+            if e.errno in (98, 48, 10048):  # EADDRINUSE on Linux, macOS, Windows
+                return False
+            raise
+        self._httpd.daemon_threads = True
+        self._httpd.audio_server = self
+        threading.Thread(target=self._httpd.serve_forever, name="audio-server", daemon=True).start()
+        return True
+
+
+class _AudioRequestHandler(BaseHTTPRequestHandler):
+    """GET/HEAD ``/audio/<name>?expires=...&sig=...`` with single byte ranges"""
+
+    def do_HEAD(self) -> None:
+        self._serve(send_body=False)
+
+    def do_GET(self) -> None:
+        self._serve(send_body=True)
+
+    def log_message(self, format, *args) -> None:
+        # Every range request would otherwise be printed to stderr
+        pass
+
+    def _serve(self, send_body: bool) -> None:
+        server: AudioServer = self.server.audio_server
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/ping":
+            self._answer_ping(server, query.get("challenge", [""])[0], send_body)
+            return
+        name = unquote(url.path[len("/audio/"):]) if url.path.startswith("/audio/") else ""
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if not server.verify(name, query.get("expires", [""])[0], query.get("sig", [""])[0]):
+            self.send_error(HTTPStatus.FORBIDDEN)
+            return
+        path = os.path.join(server.audio_dir, name)
+        mime = audio_mime_type(path)
+        if mime is None:
+            self.send_error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+            return
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        with f:
+            stat = os.fstat(f.fileno())
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+            if etag in (self.headers.get("If-None-Match") or ""):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self._send_cache_headers(etag, query)
+                self.end_headers()
+                return
+            try:
+                byte_range = _parse_range(self.headers.get("Range"), stat.st_size)
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start, end = byte_range if byte_range else (0, stat.st_size - 1)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT if byte_range else HTTPStatus.OK)
+            self.send_header("Content-Type", mime)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+            if "download" in query:
+                self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self._send_cache_headers(etag, query)
+            self.end_headers()
+            if not send_body:
+                return
+
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining > 0:
+                    block = f.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    remaining -= len(block)
+            except (BrokenPipeError, ConnectionResetError):
+                # The browser stopped reading, e.g. after seeking elsewhere
+                pass
+
+    def _answer_ping(self, server: AudioServer, challenge: str, send_body: bool) -> None:
+        if not re.fullmatch(r"[0-9a-f]{1,64}", challenge):
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return
+        body = server._challenge_response(challenge).encode("ascii")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_cache_headers(self, etag: str, query: Dict) -> None:
+        self.send_header("ETag", etag)
+        # Private: the signed URL is the only credential, so shared caches must not keep it
+        max_age = max(int(query.get("expires", ["0"])[0]) - int(time.time()), 0)
+        self.send_header("Cache-Control", f"private, max-age={max_age}")
+
+
+_servers: Dict[str, AudioServer] = {}
+_servers_retry_at: Dict[str, float] = {}
+_servers_lock = threading.Lock()
+
+
+def start_audio_server(audio_dir: str, port: int, key_path: str,
+                       public_url: Optional[str] = None) -> Optional[AudioServer]:
+    """Return the process-wide server for ``audio_dir``, starting it if needed
+
+    A ``port`` of 0 disables the server and returns None, so callers fall
+    back to handing recordings to Streamlit. So does a port held by a
+    program that is not a peer sharing ``key_path``; binding it is retried
+    every ``PEER_RETRY_INTERVAL`` seconds. Safe to call on every rerun.
+    """
+    if not port:
+        return None
+    key = os.path.abspath(audio_dir)
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is None:
+            if time.monotonic() < _servers_retry_at.get(key, 0.0):
+                return None
+            candidate = AudioServer(audio_dir, port, key_path, public_url)
+            if not (candidate.start() or candidate.peer_accepts_key()):
+                _servers_retry_at[key] = time.monotonic() + PEER_RETRY_INTERVAL
+                return None
+            server = _servers[key] = candidate
+        return server
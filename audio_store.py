@@ -0,0 +1,228 @@
+"""Shared audio file helpers for the Play Africa feedback apps"""
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+# How long a directory listing is trusted before its mtime is checked again
+RESCAN_INTERVAL = 2.0
+
+# Playable recording formats by file extension
+AUDIO_MIME_TYPES = {
+    ".wav": "audio/wav",
+    ".webm": "audio/webm",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".m4a": "audio/mp4",
+    ".mp3": "audio/mpeg",
+}
+
+# Upper bound for one streamed recording; 30 seconds of browser audio is well under 1 MB
+MAX_RECORDING_BYTES = 20 * 1024 * 1024
+
+# Recordings still being streamed; ones untouched this long (seconds) were abandoned
+PARTIAL_SUFFIX = ".part"
+STALE_PARTIAL_AGE = 24 * 60 * 60
+
+_RECORDING_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class AudioIndex:
+    """Cached listing of the recordings in one audio directory
+
+    Validating ``audio_file`` paths used to cost an ``os.path.exists`` per
+    row on every load and again per rendered row. The index lists the
+    directory once with ``scandir`` and answers membership from memory.
+    Writes made through this process update it directly; changes made by
+    other processes are picked up by re-listing when the directory mtime
+    moves, which is checked at most every ``RESCAN_INTERVAL`` seconds.
+    """
+
+    def __init__(self, audio_dir: str):
+        self.audio_dir = os.path.normpath(audio_dir)
+        self._names: Set[str] = set()
+        self._mtime_ns: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < RESCAN_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < RESCAN_INTERVAL:
+                return
+            try:
+                mtime_ns = os.stat(self.audio_dir).st_mtime_ns
+            except FileNotFoundError:
+                self._names, self._mtime_ns = set(), None
+            else:
+                if mtime_ns != self._mtime_ns:
+                    with os.scandir(self.audio_dir) as entries:
+                        self._names = {entry.name for entry in entries if entry.is_file()}
+                    self._mtime_ns = mtime_ns
+            self._checked_at = now
+
+    def refresh(self) -> None:
+        """Re-list the directory on the next lookup"""
+        with self._lock:
+            self._checked_at = 0.0
+            self._mtime_ns = None
+
+    def _name_in_dir(self, path: str) -> Optional[str]:
+        head, name = os.path.split(path)
+        return name if os.path.normpath(head or ".") == self.audio_dir else None
+
+    def contains(self, path) -> bool:
+        """Whether ``path`` names an existing recording"""
+        if not isinstance(path, str) or not path:
+            return False
+        name = self._name_in_dir(path)
+        if name is None:
+            # Paths outside the audio directory are rare; stat them directly
+            return os.path.exists(path)
+        self._refresh_if_stale()
+        return name in self._names
+
+    def valid_path(self, path) -> Optional[str]:
+        """``path`` if it names an existing recording, otherwise None"""
+        return path if self.contains(path) else None
+
+    def add(self, path: str) -> None:
+        """Record a file this process just wrote"""
+        name = self._name_in_dir(path)
+        if name is not None:
+            with self._lock:
+                self._names.add(name)
+
+    def discard(self, path: str) -> None:
+        """Forget a file this process just removed"""
+        name = self._name_in_dir(path)
+        if name is not None:
+            with self._lock:
+                self._names.discard(name)
+
+    def remove(self, path) -> bool:
+        """Delete a recording if it exists, returning whether one was removed"""
+        if not self.contains(path):
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        finally:
+            self.discard(path)
+        return True
+
+
+_indexes: Dict[str, AudioIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_audio_index(audio_dir: str) -> AudioIndex:
+    """Return the process-wide index for ``audio_dir``
+
+    Like ``storage.open_store``, this lives in an imported module so it
+    survives Streamlit's script reruns and is shared by all sessions.
+    """
+    key = os.path.abspath(audio_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = AudioIndex(audio_dir)
+            _indexes[key] = index
+        return index
+
+
+def audio_mime_type(path) -> Optional[str]:
+    """MIME type of a playable recording, or None for unsupported files"""
+    if not isinstance(path, str) or not path:
+        return None
+    return AUDIO_MIME_TYPES.get(os.path.splitext(path)[1].lower())
+
+
+def _extension_for_mime(mime: str) -> str:
+    base = (mime or "").split(";")[0].strip().lower()
+    if base == "audio/mp4":
+        return ".m4a"
+    for ext, known in AUDIO_MIME_TYPES.items():
+        if known == base:
+            return ext
+    raise ValueError(f"Unsupported recording format: {mime!r}")
+
+
+def write_recording_frame(audio_dir: str, header: Dict, payload: bytes) -> Tuple[int, Optional[str]]:
+    """Append one streamed frame of a recording, returning ``(ack, path)``
+
+    Frames carry the byte ``offset`` of their payload, so a frame that is
+    delivered twice (Streamlit reruns with the last component value) or
+    overlaps data already on disk only writes its new tail. A frame that
+    starts past the end of the partial file is not written; the returned
+    ``ack`` is the number of bytes held, which tells the browser where to
+    resend from. When the ``final`` frame completes ``total`` bytes the
+    partial file is moved to ``recording_<id>.<ext>`` and ``path`` is set;
+    it stays None on every other call, including repeats of the final frame.
+    """
+    recording_id = str(header.get("recording_id", ""))
+    if not _RECORDING_ID.fullmatch(recording_id):
+        raise ValueError("Invalid recording id")
+    offset = int(header.get("offset", 0))
+    final = bool(header.get("final"))
+    total = int(header["total"]) if final else None
+    if offset < 0 or offset + len(payload) > MAX_RECORDING_BYTES:
+        raise ValueError("Recording is too large")
+    path = os.path.join(audio_dir, f"recording_{recording_id}{_extension_for_mime(header.get('mime', ''))}")
+    part_path = os.path.join(audio_dir, f".recording_{recording_id}{PARTIAL_SUFFIX}")
+    os.makedirs(audio_dir, exist_ok=True, mode=0o777)
+    if offset == 0 and not os.path.exists(part_path):
+        # Starting a recording is rare enough to sweep up abandoned ones
+        remove_stale_partials(audio_dir)
+
+    if not os.path.exists(part_path) and os.path.exists(path):
+        # Already finished; this is a repeat of the final frame
+        return os.path.getsize(path), None
+
+    with open(part_path, "ab") as f:
+        size = f.tell()
+        if offset <= size < offset + len(payload):
+            f.write(payload[size - offset:])
+            size = f.tell()
+        if not final or size != total:
+            return size, None
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(part_path, 0o666)
+    os.replace(part_path, path)
+    open_audio_index(audio_dir).add(path)
+    return size, path
+
+
+def remove_stale_partials(audio_dir: str, max_age: float = STALE_PARTIAL_AGE) -> int:
+    """Delete partial recordings not written to for ``max_age`` seconds, returning how many"""
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(PARTIAL_SUFFIX) and entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+def clear_recordings(audio_dir: str) -> int:
+    """Delete every recording and partial upload in ``audio_dir``, returning how many files went"""
+    removed = 0
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and (audio_mime_type(entry.name) or entry.name.endswith(PARTIAL_SUFFIX)):
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    open_audio_index(audio_dir).refresh()
+    return removed
@@ -0,0 +1,567 @@
+"""Scheduled, deduplicated backups of the Play Africa feedback database
+
+A backup is a small JSON manifest naming the chunks that make up the
+table. Rows are exported in ID order and cut into chunks at content
+defined boundaries; each chunk is stored once under ``chunks/`` by the
+SHA-256 of its bytes. A backup after a few changes therefore only adds
+the chunks holding those rows, and an unchanged table adds nothing.
+Chunks are gzip compressed, and each manifest records the row count, byte
+size and SHA-256 of the CSV it restores to, so ``verify_backup`` can check
+a backup by streaming it through a hash instead of loading it.
+Full-copy ``backup_*.csv`` files from earlier versions are still listed,
+restored and pruned.
+
+Each manifest also records how far the store's change log had got when
+the rows were read, so ``restore_to_time`` can rebuild the table as of
+any later moment: it loads the newest backup taken before then and
+replays the logged changes up to it. Its output under ``restores/`` is a
+plaintext copy of every row, so the scheduler deletes it after an hour.
+
+Media files (recordings, CVs) are snapshotted separately under ``media/``:
+each distinct file content is stored once in ``media/objects`` by its
+SHA-256, and every snapshot is a directory of hard links to those objects
+plus a manifest, so a snapshot only costs the files that are new.
+"""
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from safe_io import atomic_write, file_lock, write_json
+from storage import DELETED_AT_COLUMN, ID_COLUMN, STORED_COLUMNS, SubmissionStore, read_submissions_csv
+
+BACKUP_PATTERNS = ("backup_[0-9]*.json", "backup_[0-9]*.csv")
+STATE_FILE = "backup_state.json"
+CHUNKS_DIR = "chunks"
+
+# A chunk ends after each row whose ID (random in its last bits) is a
+# multiple of CHUNK_ROWS, so chunks average that many rows and inserting or
+# removing a row only changes the chunk it falls in
+CHUNK_ROWS = 1000
+MAX_CHUNK_ROWS = 8 * CHUNK_ROWS
+
+# Read size when streaming backups
+BLOCK_SIZE = 1 << 20
+
+MEDIA_DIR = "media"
+OBJECTS_DIR = "objects"
+MEDIA_PATTERN = "media_[0-9]*.json"
+
+RESTORES_DIR = "restores"
+RESTORE_PATTERN = "restore_*.csv"
+RESTORE_MAX_AGE = 60 * 60
+
+
+def _read_state(backup_dir: str) -> Dict:
+    try:
+        with open(os.path.join(backup_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _read_manifest(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_backups(backup_dir: str) -> List[str]:
+    """Backup manifests (and legacy full-copy backups) in ``backup_dir``, oldest first"""
+    # The timestamp in the name sorts chronologically
+    return sorted(
+        (path for pattern in BACKUP_PATTERNS for path in glob.glob(os.path.join(backup_dir, pattern))),
+        key=os.path.basename
+    )
+
+
+def _chunk_path(backup_dir: str, digest: str, compressed: bool = True) -> str:
+    # Chunks written before compression was added are plain .csv files
+    return os.path.join(backup_dir, CHUNKS_DIR, digest[:2], f"{digest}.csv{'.gz' if compressed else ''}")
+
+
+def _open_chunk(backup_dir: str, digest: str) -> BinaryIO:
+    """Open a chunk for reading its uncompressed bytes"""
+    path = _chunk_path(backup_dir, digest)
+    if os.path.exists(path):
+        return gzip.open(path, "rb")
+    return open(_chunk_path(backup_dir, digest, compressed=False), "rb")
+
+
+def _ends_chunk(submission_id) -> bool:
+    try:
+        return int(str(submission_id)[-8:], 16) % CHUNK_ROWS == 0
+    except ValueError:
+        return False
+
+
+def _store_chunk(backup_dir: str, data: bytes) -> str:
+    """Store ``data`` unless an identical chunk exists, returning its digest"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(backup_dir, digest)
+    if not os.path.exists(path) and not os.path.exists(_chunk_path(backup_dir, digest, compressed=False)):
+        with atomic_write(path, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+            gz.write(data)
+    return digest
+
+
+def _write_chunks(backup_dir: str, header: bytes, rows: Iterable[tuple]) -> Tuple[List[str], Dict]:
+    """Split ``rows`` into content-defined chunks and store them
+
+    Returns the chunk digests and the integrity record (rows, bytes and
+    SHA-256) of the CSV they restore to, ``header`` included.
+    """
+    digests, count = [], 0
+    total = hashlib.sha256(header)
+    size = len(header)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    in_chunk = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        in_chunk += 1
+        if in_chunk >= MAX_CHUNK_ROWS or _ends_chunk(row[0]):
+            data = buffer.getvalue().encode("utf-8")
+            digests.append(_store_chunk(backup_dir, data))
+            total.update(data)
+            size += len(data)
+            buffer.seek(0)
+            buffer.truncate()
+            in_chunk = 0
+    if in_chunk:
+        data = buffer.getvalue().encode("utf-8")
+        digests.append(_store_chunk(backup_dir, data))
+        total.update(data)
+        size += len(data)
+    return digests, {"rows": count, "bytes": size, "sha256": total.hexdigest()}
+
+
+def write_backup(store: SubmissionStore, backup_dir: str) -> str:
+    """Back up every row, returning the backup's manifest path
+
+    If nothing changed since the newest backup, no new manifest is
+    written and that backup's path is returned instead.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    with file_lock(os.path.join(backup_dir, STATE_FILE)):
+        # Read first, so a write racing the export triggers another backup
+        version = store.data_version()
+        header = (",".join(STORED_COLUMNS) + "\n").encode("utf-8")
+        with store.read_snapshot() as (event_seq, rows):
+            chunks, integrity = _write_chunks(backup_dir, header, rows)
+        backups = [path for path in list_backups(backup_dir) if path.endswith(".json")]
+        if backups and _read_manifest(backups[-1]).get("chunks") == chunks:
+            backup_path = backups[-1]
+        else:
+            backup_path = os.path.join(backup_dir, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            write_json(backup_path, {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "data_version": version,
+                "event_seq": event_seq,
+                "columns": STORED_COLUMNS,
+                **integrity,
+                "chunks": chunks,
+            }, indent=2)
+        write_json(os.path.join(backup_dir, STATE_FILE), {
+            "data_version": version,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "file": os.path.basename(backup_path),
+        }, indent=2)
+    return backup_path
+
+
+def _iter_backup(backup_path: str) -> Iterator[bytes]:
+    """Stream the CSV a backup restores to, block by block"""
+    if backup_path.endswith(".csv"):
+        # Legacy full copy
+        with open(backup_path, "rb") as f:
+            yield from iter(lambda: f.read(BLOCK_SIZE), b"")
+        return
+    backup_dir = os.path.dirname(backup_path)
+    manifest = _read_manifest(backup_path)
+    yield (",".join(manifest["columns"]) + "\n").encode("utf-8")
+    for digest in manifest["chunks"]:
+        with _open_chunk(backup_dir, digest) as f:
+            yield from iter(lambda: f.read(BLOCK_SIZE), b"")
+
+
+def restore_backup(backup_path: str, out_path: str) -> int:
+    """Rebuild the full CSV a backup holds at ``out_path``, returning its row count"""
+    with atomic_write(out_path, "wb") as dst:
+        for block in _iter_backup(backup_path):
+            dst.write(block)
+    if backup_path.endswith(".csv"):
+        return len(read_submissions_csv(out_path))
+    return _read_manifest(backup_path)["rows"]
+
+
+def _iter_backup_rows(backup_path: str) -> Iterator[List[str]]:
+    """Stream the rows of a chunked backup as lists of strings"""
+    backup_dir = os.path.dirname(backup_path)
+    for digest in _read_manifest(backup_path)["chunks"]:
+        with _open_chunk(backup_dir, digest) as f:
+            yield from csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))
+
+
+def _replay(conn: sqlite3.Connection, op: str, submission_id: Optional[str], data: Optional[Dict]) -> None:
+    """Apply one logged change to a replay table"""
+    if op == "insert":
+        conn.execute(
+            f"INSERT OR REPLACE INTO replay ({', '.join(STORED_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in STORED_COLUMNS)})",
+            [data.get(col) for col in STORED_COLUMNS]
+        )
+    elif op in ("delete", "restore"):
+        conn.execute(
+            f"UPDATE replay SET {DELETED_AT_COLUMN} = ? WHERE {ID_COLUMN} = ?", (data[DELETED_AT_COLUMN], submission_id)
+        )
+    elif op == "update":
+        columns = [col for col in data if col in STORED_COLUMNS]
+        conn.execute(
+            f"UPDATE replay SET {', '.join(f'{col} = ?' for col in columns)} WHERE {ID_COLUMN} = ?",
+            [data[col] for col in columns] + [submission_id]
+        )
+    elif op in ("purge", "archive"):
+        conn.execute(f"DELETE FROM replay WHERE {ID_COLUMN} = ?", (submission_id,))
+    elif op == "clear":
+        deleted = data["deleted"]
+        where = "" if deleted is None else f"WHERE {DELETED_AT_COLUMN} IS {'NOT ' if deleted else ''}NULL"
+        conn.execute(f"DELETE FROM replay {where}")
+
+
+def new_restore_path(backup_dir: str, target: datetime) -> str:
+    """A fresh path under ``restores/`` for rebuilding the rows as of ``target``"""
+    name = f"restore_{target.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}.csv"
+    return os.path.join(backup_dir, RESTORES_DIR, name)
+
+
+def prune_restores(backup_dir: str, max_age: float = RESTORE_MAX_AGE) -> List[str]:
+    """Delete point-in-time restore files older than ``max_age`` seconds, returning their paths"""
+    cutoff = time.time() - max_age
+    removed = []
+    for path in glob.glob(os.path.join(backup_dir, RESTORES_DIR, RESTORE_PATTERN)):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def restore_to_time(store: SubmissionStore, backup_dir: str, target: datetime, out_path: str) -> int:
+    """Rebuild every row as it was at ``target`` into a CSV, returning the row count
+
+    Starts from the newest backup taken at or before ``target`` and
+    replays the store's change log from that backup's position up to
+    ``target``. Rows and events are streamed through a temporary SQLite
+    database, so the work is bounded by one backup plus the log since it.
+    """
+    until = target.isoformat(timespec="seconds")
+    base = None
+    for path in reversed([path for path in list_backups(backup_dir) if path.endswith(".json")]):
+        manifest = _read_manifest(path)
+        if "event_seq" in manifest and manifest["created_at"] <= until:
+            base = path, manifest
+            break
+    if base is None:
+        raise ValueError(f"No backup taken before {until} to restore from")
+    base_path, manifest = base
+    columns = manifest["columns"]
+    if not set(columns) <= set(STORED_COLUMNS):
+        raise ValueError(f"{os.path.basename(base_path)} was taken with a different table layout")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(os.path.join(tmp_dir, "replay.db"))
+        try:
+            conn.execute(
+                f"CREATE TABLE replay ({', '.join(STORED_COLUMNS)}, PRIMARY KEY ({ID_COLUMN})) WITHOUT ROWID"
+            )
+            # Columns added since the backup was taken are left empty
+            insert = f"INSERT INTO replay ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+            batch = []
+            for row in _iter_backup_rows(base_path):
+                batch.append([value if value != "" else None for value in row])
+                if len(batch) >= 1000:
+                    conn.executemany(insert, batch)
+                    batch = []
+            conn.executemany(insert, batch)
+
+            for _, _, op, submission_id, data in store.iter_events(manifest["event_seq"], until):
+                _replay(conn, op, submission_id, data)
+            conn.commit()
+
+            count = 0
+            with atomic_write(out_path, permissions=0o600, newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(STORED_COLUMNS)
+                for row in conn.execute(f"SELECT {', '.join(STORED_COLUMNS)} FROM replay ORDER BY {ID_COLUMN}"):
+                    writer.writerow(row)
+                    count += 1
+        finally:
+            conn.close()
+    return count
+
+
+def verify_backup(backup_path: str) -> bool:
+    """Check a backup against its manifest without parsing it
+
+    Every chunk is streamed through SHA-256 and compared with the digest
+    it is stored under, and the whole restored CSV is compared with the
+    size and checksum recorded when the backup was taken. Legacy CSV
+    backups record nothing to compare with, so for them this only checks
+    that the file can be read in full.
+    """
+    try:
+        if backup_path.endswith(".csv"):
+            for _ in _iter_backup(backup_path):
+                pass
+            return True
+
+        backup_dir = os.path.dirname(backup_path)
+        manifest = _read_manifest(backup_path)
+        header = (",".join(manifest["columns"]) + "\n").encode("utf-8")
+        total = hashlib.sha256(header)
+        size = len(header)
+        for digest in manifest["chunks"]:
+            chunk = hashlib.sha256()
+            with _open_chunk(backup_dir, digest) as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                    chunk.update(block)
+                    total.update(block)
+                    size += len(block)
+            if chunk.hexdigest() != digest:
+                return False
+        if "sha256" not in manifest:
+            # Taken before checksums were recorded; the chunks are intact
+            return True
+        return size == manifest["bytes"] and total.hexdigest() == manifest["sha256"]
+    except (OSError, EOFError, ValueError, KeyError, zlib.error):
+        # Missing or truncated chunks, bad gzip data or a damaged manifest
+        return False
+
+
+def verify_backups(backup_dir: str) -> Dict[str, bool]:
+    """Verify every backup in ``backup_dir``, keyed by file name"""
+    return {os.path.basename(path): verify_backup(path) for path in list_backups(backup_dir)}
+
+
+def prune_backups(backup_dir: str, keep: int) -> List[str]:
+    """Delete all but the newest ``keep`` backups, returning the removed paths
+
+    Chunks no longer named by any remaining backup are deleted too.
+    """
+    with file_lock(os.path.join(backup_dir, STATE_FILE)):
+        backups = list_backups(backup_dir)
+        removed = backups[:max(len(backups) - keep, 0)]
+        for path in removed:
+            os.remove(path)
+
+        referenced: Set[str] = set()
+        for path in backups[len(removed):]:
+            if path.endswith(".json"):
+                referenced.update(_read_manifest(path)["chunks"])
+        for path in glob.glob(os.path.join(backup_dir, CHUNKS_DIR, "*", "*.csv*")):
+            if os.path.basename(path).split(".")[0] not in referenced:
+                os.remove(path)
+    return removed
+
+
+def _store_object(media_dir: str, path: str) -> str:
+    """Copy ``path`` into the object store unless its content is there, returning its digest"""
+    objects_dir = os.path.join(media_dir, OBJECTS_DIR)
+    os.makedirs(objects_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    # Hash while copying, so the object matches its name even if the
+    # source changes underneath
+    fd, tmp_path = tempfile.mkstemp(dir=objects_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dst, open(path, "rb") as src:
+            for block in iter(lambda: src.read(BLOCK_SIZE), b""):
+                digest.update(block)
+                dst.write(block)
+        object_path = os.path.join(objects_dir, digest.hexdigest()[:2], digest.hexdigest())
+        if os.path.exists(object_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(tmp_path, object_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest()
+
+
+def _object_path(media_dir: str, digest: str) -> str:
+    return os.path.join(media_dir, OBJECTS_DIR, digest[:2], digest)
+
+
+def list_media_snapshots(backup_dir: str) -> List[str]:
+    """Media snapshot manifests in ``backup_dir``, oldest first"""
+    return sorted(glob.glob(os.path.join(backup_dir, MEDIA_DIR, MEDIA_PATTERN)))
+
+
+def snapshot_media(backup_dir: str, sources: Dict[str, str]) -> str:
+    """Snapshot the files matching ``sources`` (a name -> glob pattern map), returning the manifest path
+
+    Files are filed under their source name. Files whose size and mtime
+    match the previous snapshot are not read again, and if nothing changed
+    at all no new snapshot is made and the previous one is returned.
+    """
+    media_dir = os.path.join(backup_dir, MEDIA_DIR)
+    os.makedirs(media_dir, exist_ok=True)
+    with file_lock(os.path.join(media_dir, STATE_FILE)):
+        snapshots = list_media_snapshots(backup_dir)
+        previous = _read_manifest(snapshots[-1])["files"] if snapshots else {}
+        files = {}
+        for name, pattern in sources.items():
+            for path in sorted(glob.glob(pattern)):
+                base = os.path.basename(path)
+                # Skip in-progress and bookkeeping files
+                if base.startswith(".") or base.endswith((".tmp", ".part", ".lock")) or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                known = previous.get(f"{name}/{base}")
+                if (known and known["bytes"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns
+                        and os.path.exists(_object_path(media_dir, known["sha256"]))):
+                    digest = known["sha256"]
+                else:
+                    digest = _store_object(media_dir, path)
+                files[f"{name}/{base}"] = {"sha256": digest, "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        if snapshots and files == previous:
+            return snapshots[-1]
+
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        tree = os.path.join(media_dir, stamp)
+        for relative, info in files.items():
+            link_path = os.path.join(tree, *relative.split("/"))
+            os.makedirs(os.path.dirname(link_path), exist_ok=True)
+            if os.path.exists(link_path):
+                os.remove(link_path)
+            try:
+                os.link(_object_path(media_dir, info["sha256"]), link_path)
+            except OSError:
+                # Filesystems without hard links get a copy
+                shutil.copy2(_object_path(media_dir, info["sha256"]), link_path)
+        manifest_path = os.path.join(media_dir, f"media_{stamp}.json")
+        write_json(manifest_path, {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "files": files,
+        }, indent=2)
+    return manifest_path
+
+
+def prune_media_snapshots(backup_dir: str, keep: int) -> List[str]:
+    """Delete all but the newest ``keep`` media snapshots and objects none of them use"""
+    media_dir = os.path.join(backup_dir, MEDIA_DIR)
+    if not os.path.isdir(media_dir):
+        return []
+    with file_lock(os.path.join(media_dir, STATE_FILE)):
+        snapshots = list_media_snapshots(backup_dir)
+        removed = snapshots[:max(len(snapshots) - keep, 0)]
+        for path in removed:
+            shutil.rmtree(os.path.join(media_dir, os.path.basename(path)[len("media_"):-len(".json")]),
+                          ignore_errors=True)
+            os.remove(path)
+
+        referenced: Set[str] = set()
+        for path in snapshots[len(removed):]:
+            referenced.update(info["sha256"] for info in _read_manifest(path)["files"].values())
+        for path in glob.glob(os.path.join(media_dir, OBJECTS_DIR, "*", "*")):
+            if os.path.basename(path) not in referenced and not path.endswith(".tmp"):
+                os.remove(path)
+    return removed
+
+
+class BackupScheduler:
+    """Background thread that backs the store up when its data has changed
+
+    Every ``interval`` seconds the store's data version is compared with
+    the one recorded by the last backup (from any process, via
+    ``backup_state.json``); a backup is only written if they differ, and
+    afterwards all but the newest ``keep`` backups are pruned. When
+    ``media`` sources are given, their files are snapshotted on the same
+    schedule, and point-in-time restore files past ``RESTORE_MAX_AGE``
+    are deleted. Page renders never touch the backup directory.
+    """
+
+    def __init__(self, store: Optional[SubmissionStore], backup_dir: str, interval: float, keep: int,
+                 media: Optional[Dict[str, str]] = None):
+        self.store = store
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self.media = media
+        self.last_error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def run_once(self) -> Optional[str]:
+        """Back up if the data changed since the last backup, returning the new file"""
+        backup_path = None
+        if self.store is not None and _read_state(self.backup_dir).get("data_version") != self.store.data_version():
+            backup_path = write_backup(self.store, self.backup_dir)
+            if not verify_backup(backup_path):
+                raise RuntimeError(f"Backup {os.path.basename(backup_path)} failed verification")
+            prune_backups(self.backup_dir, self.keep)
+
+            # The log is only needed from the oldest backup it can be replayed onto
+            positions = [
+                _read_manifest(path).get("event_seq") for path in list_backups(self.backup_dir) if path.endswith(".json")
+            ]
+            positions = [seq for seq in positions if seq is not None]
+            if positions:
+                self.store.prune_events(min(positions))
+
+        if self.media:
+            snapshot_media(self.backup_dir, self.media)
+            prune_media_snapshots(self.backup_dir, self.keep)
+        prune_restores(self.backup_dir)
+        return backup_path
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                # Keep the thread alive; the next tick tries again
+                self.last_error = e
+
+
+_schedulers: Dict[str, BackupScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def start_backup_scheduler(store: Optional[SubmissionStore], backup_dir: str, interval: float,
+                           keep: int, media: Optional[Dict[str, str]] = None) -> BackupScheduler:
+    """Start the process-wide scheduler for ``backup_dir`` if it is not running yet
+
+    Safe to call on every script rerun; like ``storage.open_store``, the
+    registry lives in an imported module and so outlives the rerun.
+    """
+    key = os.path.abspath(backup_dir)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = BackupScheduler(store, backup_dir, interval, keep, media)
+            scheduler.start()
+            _schedulers[key] = scheduler
+        return scheduler
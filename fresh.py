@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from streamlit_lottie import st_lottie
 import altair as alt
@@ -11,49 +11,93 @@ import qrcode
 import base64
 from io import BytesIO
 import hashlib
-import shutil
-from typing import Optional, Tuple
-from streamlit.components.v1 import html
+from typing import List, Optional, Tuple
 import platform
 
+from audio_server import start_audio_server
+from audio_store import audio_mime_type, open_audio_index
+from backups import new_restore_path, prune_restores, restore_to_time, snapshot_media, start_backup_scheduler, verify_backup, write_backup
+from recorder import streaming_recorder
+from safe_io import file_lock, write_json
+from storage import SUBMISSION_COLUMNS, open_store, read_submissions_csv
+from transcode import start_transcoder
+
 # Constants - using absolute paths for reliability
 DATA_DIR = os.path.abspath("data")
-SUBMISSIONS_FILE = os.path.join(DATA_DIR, "submissions.csv")
+DATABASE_FILE = os.path.join(DATA_DIR, "feedback.db")
 AUDIO_DIR = os.path.join(DATA_DIR, "audio")
 BACKUP_DIR = os.path.join(DATA_DIR, "backups")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+
+# Legacy CSV storage, imported into DATABASE_FILE on first start
+SUBMISSIONS_FILE = os.path.join(DATA_DIR, "submissions.csv")
+SUBMISSIONS_LOG_FILE = os.path.join(DATA_DIR, "submissions.log")
 DELETED_ENTRIES_FILE = os.path.join(DATA_DIR, "deleted_entries.csv")
 
+# Retention: submissions older than this, and entries deleted longer ago than
+# the grace period, move to the cold archive (None keeps them in the database)
+RETENTION_DAYS = 365
+DELETED_GRACE_DAYS = 30
+
+# Analytics views open on this many days of submissions
+ANALYTICS_DEFAULT_DAYS = 90
+
+# Scheduled backups: how often (seconds) to check for changes, and how many to keep
+BACKUP_INTERVAL = 15 * 60
+BACKUP_KEEP = 96
+
+# Media backed up alongside the data, by content hash
+MEDIA_BACKUP_SOURCES = {"audio": os.path.join(AUDIO_DIR, "*")}
+
+# Recordings are transcoded to mono Opus in the background: how often
+# (seconds) to look for new ones, and how many ffmpeg processes to run
+TRANSCODE_INTERVAL = 30
+TRANSCODE_WORKERS = 2
+
+# Recordings are streamed to browsers by a small HTTP server with range
+# requests when AUDIO_SERVER_PORT is set; AUDIO_PUBLIC_URL is the address
+# browsers reach it on (e.g. behind a reverse proxy). With no port, as on
+# Streamlit Cloud, recordings are handed to Streamlit instead.
+AUDIO_SERVER_PORT = int(os.environ.get("AUDIO_SERVER_PORT", "0"))
+AUDIO_PUBLIC_URL = os.environ.get("AUDIO_PUBLIC_URL")
+AUDIO_URL_KEY_FILE = os.path.join(DATA_DIR, "audio_url.key")
+
 # Ensure directories exist with proper permissions
 os.makedirs(DATA_DIR, exist_ok=True, mode=0o777)
 os.makedirs(AUDIO_DIR, exist_ok=True, mode=0o777)
 os.makedirs(BACKUP_DIR, exist_ok=True, mode=0o777)
 
 # Define expected columns for submissions
-EXPECTED_COLUMNS = [
-    'timestamp', 'school', 'group_type', 'children_no', 'children_age',
-    'adults_present', 'visit_date', 'programme', 'engagement', 'safety',
-    'cleanliness', 'fun', 'learning', 'planning', 'safety_space', 'comments',
-    'audio_file', 'device_type'
-]
+EXPECTED_COLUMNS = SUBMISSION_COLUMNS
 
 def initialize_data_files():
     """Initialize data files with proper structure and permissions"""
     try:
-        # Initialize submissions file
-        if not os.path.exists(SUBMISSIONS_FILE) or os.path.getsize(SUBMISSIONS_FILE) == 0:
-            pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(SUBMISSIONS_FILE, index=False)
-            os.chmod(SUBMISSIONS_FILE, 0o666)
-        
-        # Initialize deleted entries file
-        if not os.path.exists(DELETED_ENTRIES_FILE) or os.path.getsize(DELETED_ENTRIES_FILE) == 0:
-            pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(DELETED_ENTRIES_FILE, index=False)
-            os.chmod(DELETED_ENTRIES_FILE, 0o666)
-        
-        # Initialize users file
-        if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
-            with open(USERS_FILE, "w") as f:
-                json.dump({
+        # Import legacy CSV files into the database (no-op once migrated)
+        open_store(DATABASE_FILE).migrate_from_csv(
+            SUBMISSIONS_FILE, DELETED_ENTRIES_FILE, SUBMISSIONS_LOG_FILE, BACKUP_DIR
+        )
+
+        # Move old and long-deleted rows to the cold archive (checked hourly)
+        open_store(DATABASE_FILE).apply_retention(RETENTION_DAYS, DELETED_GRACE_DAYS)
+
+        # Back up in the background whenever the data has changed
+        start_backup_scheduler(
+            open_store(DATABASE_FILE), BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, media=MEDIA_BACKUP_SOURCES
+        )
+        # Restores used to be written to data/restores and never deleted
+        prune_restores(DATA_DIR)
+
+        # Shrink new recordings off the request path (skipped without ffmpeg)
+        start_transcoder(open_store(DATABASE_FILE), AUDIO_DIR, TRANSCODE_INTERVAL, TRANSCODE_WORKERS)
+
+        # Serve recordings over HTTP with range support (if configured)
+        start_audio_server(AUDIO_DIR, AUDIO_SERVER_PORT, AUDIO_URL_KEY_FILE, AUDIO_PUBLIC_URL)
+
+        # Initialize users file; the lock stops two workers both creating it
+        with file_lock(USERS_FILE):
+            if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
+                write_json(USERS_FILE, {
                     "admin": {
                         "password": hashlib.sha256("Playafrica@2025!*".encode()).hexdigest(),
                         "role": "admin"
@@ -62,8 +106,7 @@ def initialize_data_files():
                         "password": hashlib.sha256("Guest@2025".encode()).hexdigest(),
                         "role": "Guest"
                     }
-                }, f)
-            os.chmod(USERS_FILE, 0o666)
+                })
     except Exception as e:
         st.error(f"Initialization error: {str(e)}")
 
@@ -71,195 +114,14 @@ def initialize_data_files():
 initialize_data_files()
 
 def audio_recorder():
-    """Audio recorder component that works in Streamlit Cloud"""
-    # Generate a unique key for this component instance
-    component_key = f"audio_recorder_{hash(datetime.now().timestamp())}"
-    
-    # HTML and JavaScript for the audio recorder
-    html_code = f"""
-    <script>
-    // Unique namespace for this component
-    const {component_key} = {{
-        recorder: null,
-        audioChunks: [],
-        audioPreview: null,
-        
-        startRecording: async function() {{
-            try {{
-                this.audioChunks = [];
-                const stream = await navigator.mediaDevices.getUserMedia({{ audio: true }});
-                this.recorder = new MediaRecorder(stream);
-                
-                this.recorder.ondataavailable = e => {{
-                    if (e.data.size > 0) {{
-                        this.audioChunks.push(e.data);
-                    }}
-                }};
-                
-                this.recorder.start(100);
-                document.getElementById("status_{component_key}").innerText = "Recording... (Max 30 seconds)";
-                document.getElementById("preview-container_{component_key}").style.display = "none";
-                
-                // Auto-stop after 30 seconds
-                setTimeout(() => {{
-                    if (this.recorder && this.recorder.state === 'recording') {{
-                        this.stopRecording();
-                    }}
-                }}, 30000);
-                
-            }} catch (error) {{
-                console.error("Recording error:", error);
-                document.getElementById("status_{component_key}").innerText = "Error: " + error.message;
-                window.parent.postMessage({{
-                    type: 'streamlitError',
-                    error: "Failed to start recording: " + error.message,
-                    componentKey: "{component_key}"
-                }}, '*');
-            }}
-        }},
-        
-        stopRecording: async function() {{
-            try {{
-                if (!this.recorder || this.recorder.state === 'inactive') {{
-                    document.getElementById("status_{component_key}").innerText = "No active recording";
-                    return;
-                }}
-                
-                await new Promise((resolve) => {{
-                    this.recorder.onstop = async () => {{
-                        try {{
-                            if (this.audioChunks.length === 0) {{
-                                throw new Error("No audio data recorded");
-                            }}
-                            
-                            const audioBlob = new Blob(this.audioChunks, {{ type: 'audio/wav' }});
-                            const arrayBuffer = await audioBlob.arrayBuffer();
-                            const base64Data = this.arrayBufferToBase64(arrayBuffer);
-                            
-                            if (this.audioPreview) {{
-                                URL.revokeObjectURL(this.audioPreview);
-                            }}
-                            this.audioPreview = URL.createObjectURL(audioBlob);
-                            const previewContainer = document.getElementById("preview-container_{component_key}");
-                            previewContainer.style.display = "block";
-                            document.getElementById("audio-preview_{component_key}").src = this.audioPreview;
-                            
-                            // Send the audio data to Streamlit
-                            window.parent.postMessage({{
-                                type: 'audioData',
-                                data: base64Data,
-                                filename: 'recording_' + new Date().getTime() + '.wav',
-                                componentKey: "{component_key}"
-                            }}, '*');
-                            
-                            document.getElementById("status_{component_key}").innerText = "Recording complete - ready to submit";
-                            resolve();
-                        }} catch (error) {{
-                            console.error("Processing error:", error);
-                            document.getElementById("status_{component_key}").innerText = "Error processing";
-                            window.parent.postMessage({{
-                                type: 'streamlitError',
-                                error: "Processing error: " + error.message,
-                                componentKey: "{component_key}"
-                            }}, '*');
-                            resolve();
-                        }} finally {{
-                            if (this.recorder && this.recorder.stream) {{
-                                this.recorder.stream.getTracks().forEach(track => track.stop());
-                            }}
-                        }}
-                    }};
-                    
-                    this.recorder.stop();
-                }});
-            }} catch (error) {{
-                console.error("Stop recording error:", error);
-                document.getElementById("status_{component_key}").innerText = "Error stopping";
-                window.parent.postMessage({{
-                    type: 'streamlitError',
-                    error: "Stop error: " + error.message,
-                    componentKey: "{component_key}"
-                }}, '*');
-            }}
-        }},
-        
-        arrayBufferToBase64: function(buffer) {{
-            let binary = '';
-            const bytes = new Uint8Array(buffer);
-            for (let i = 0; i < bytes.byteLength; i++) {{
-                binary += String.fromCharCode(bytes[i]);
-            }}
-            return window.btoa(binary);
-        }}
-    }};
-
-    // Handle messages from the parent window
-    window.addEventListener('message', (event) => {{
-        if (event.data.type === 'triggerStopRecording' && event.data.componentKey === "{component_key}") {{
-            {component_key}.stopRecording();
-        }}
-    }});
-    </script>
-    
-    <div style="margin: 10px 0; font-family: Arial, sans-serif;">
-        <button onclick="{component_key}.startRecording()" style="padding: 8px 16px; margin-right: 10px; 
-                background-color: #2E86AB; color: white; border: none; 
-                border-radius: 4px; cursor: pointer;">
-            🎤 Start Recording
-        </button>
-        <button onclick="{component_key}.stopRecording()" style="padding: 8px 16px; 
-                background-color: #F18F01; color: white; border: none; 
-                border-radius: 4px; cursor: pointer;">
-            ⏹️ Stop Recording
-        </button>
-        <p id="status_{component_key}" style="margin-top: 10px; font-size: 14px; color: #555;">
-            Ready to record (max 30 seconds)
-        </p>
-        
-        <div id="preview-container_{component_key}" style="display: none; margin-top: 15px; padding: 10px; 
-             background-color: #f5f5f5; border-radius: 5px;">
-            <p style="font-size: 14px; margin-bottom: 5px; font-weight: bold;">Your Recording:</p>
-            <audio id="audio-preview_{component_key}" controls style="width: 100%;"></audio>
-        </div>
-    </div>
-    """
-    
-    # Render the component
-    html(html_code, height=200)
-    
-    # Initialize session state for this component if not exists
-    if f"audio_data_{component_key}" not in st.session_state:
-        st.session_state[f"audio_data_{component_key}"] = None
-    if f"audio_filename_{component_key}" not in st.session_state:
-        st.session_state[f"audio_filename_{component_key}"] = None
-    if f"audio_error_{component_key}" not in st.session_state:
-        st.session_state[f"audio_error_{component_key}"] = None
-
-    # Handle audio data from the component
-    if st.session_state.get(f"audio_data_{component_key}"):
-        try:
-            audio_bytes = base64.b64decode(st.session_state[f"audio_data_{component_key}"])
-            filename = st.session_state.get(f"audio_filename_{component_key}", f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
-            audio_path = os.path.join(AUDIO_DIR, filename)
-            
-            # Ensure audio directory exists
-            os.makedirs(AUDIO_DIR, exist_ok=True, mode=0o777)
-            
-            with open(audio_path, "wb") as f:
-                f.write(audio_bytes)
-            
+    """Audio recorder that streams the recording into AUDIO_DIR while it is made"""
+    try:
+        audio_path = streaming_recorder(AUDIO_DIR, key="audio_recorder", max_seconds=30)
+        if audio_path:
             st.session_state.audio_file = audio_path
-            # Clear the component state
-            st.session_state[f"audio_data_{component_key}"] = None
-            st.session_state[f"audio_filename_{component_key}"] = None
             st.success("Recording saved successfully!")
-        except Exception as e:
-            st.error(f"Error saving recording: {str(e)}")
-            st.session_state[f"audio_error_{component_key}"] = str(e)
-
-    if st.session_state.get(f"audio_error_{component_key}"):
-        st.error(f"Recording error: {st.session_state[f'audio_error_{component_key}']}")
-        st.session_state[f"audio_error_{component_key}"] = None
+    except Exception as e:
+        st.error(f"Error saving recording: {str(e)}")
 
 def is_mobile():
     """Detect if user is on a mobile device"""
@@ -306,22 +168,17 @@ def mobile_adjusted_text_area(label, value="", height=100, key=None, placeholder
     return st.text_area(label, value, height=height, key=key, placeholder=placeholder)
 
 def create_backup() -> bool:
-    """Create a backup of submissions with verification"""
+    """Create a backup of submissions now"""
     try:
-        if not os.path.exists(SUBMISSIONS_FILE):
-            return False
-            
-        os.makedirs(BACKUP_DIR, exist_ok=True, mode=0o777)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"backup_{timestamp}.csv")
+        backup_path = write_backup(open_store(DATABASE_FILE), BACKUP_DIR)
         
-        shutil.copy2(SUBMISSIONS_FILE, backup_path)
-        os.chmod(backup_path, 0o666)
+        # Stream the backup through its checksum rather than trusting it exists
+        if not verify_backup(backup_path):
+            raise Exception("Backup failed verification")
+        
+        # Recordings are stored once per distinct file, so this only copies new ones
+        snapshot_media(BACKUP_DIR, MEDIA_BACKUP_SOURCES)
         
-        # Verify backup was created
-        if not os.path.exists(backup_path):
-            raise Exception("Backup file not created")
-            
         return True
     except Exception as e:
         st.error(f"Backup failed: {str(e)}")
@@ -347,25 +204,8 @@ def save_submission(entry: dict) -> bool:
         # Clean and validate data
         entry = {k: (v.strip() if isinstance(v, str) else v) for k, v in entry.items()}
         
-        # Load existing data
-        if os.path.exists(SUBMISSIONS_FILE) and os.path.getsize(SUBMISSIONS_FILE) > 0:
-            existing_df = pd.read_csv(SUBMISSIONS_FILE)
-            # Ensure all columns exist in the existing data
-            for col in EXPECTED_COLUMNS:
-                if col not in existing_df.columns:
-                    existing_df[col] = None
-        else:
-            existing_df = pd.DataFrame(columns=EXPECTED_COLUMNS)
-        
-        # Create new DataFrame with the entry
-        new_df = pd.DataFrame([entry])
-        
-        # Combine with existing data
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        
-        # Save to file
-        combined_df.to_csv(SUBMISSIONS_FILE, index=False)
-        os.chmod(SUBMISSIONS_FILE, 0o666)  # Ensure proper permissions
+        # Batched with concurrent submissions; returns once the batch is on disk
+        open_store(DATABASE_FILE).insert(entry)
         
         return True
     except Exception as e:
@@ -375,104 +215,124 @@ def save_submission(entry: dict) -> bool:
 def load_submissions() -> pd.DataFrame:
     """Load submissions with robust error handling"""
     try:
-        if not os.path.exists(SUBMISSIONS_FILE) or os.path.getsize(SUBMISSIONS_FILE) == 0:
-            return pd.DataFrame(columns=EXPECTED_COLUMNS)
-            
-        df = pd.read_csv(SUBMISSIONS_FILE)
-        
-        # Ensure all expected columns exist
-        for col in EXPECTED_COLUMNS:
-            if col not in df.columns:
-                df[col] = None
+        df = open_store(DATABASE_FILE).load()
                 
         # Validate audio file paths
         if 'audio_file' in df.columns:
-            df['audio_file'] = df['audio_file'].apply(
-                lambda x: x if isinstance(x, str) and os.path.exists(x) else None
-            )
+            df['audio_file'] = df['audio_file'].map(open_audio_index(AUDIO_DIR).valid_path)
             
         return df
     except Exception as e:
         st.error(f"Error loading submissions: {str(e)}")
         return pd.DataFrame(columns=EXPECTED_COLUMNS)
 
+def load_analytics_data(columns: Optional[List[str]] = None, start_date=None, end_date=None) -> pd.DataFrame:
+    """Load typed submissions for analytics, optionally only some columns and submission dates"""
+    try:
+        df = open_store(DATABASE_FILE).load_analytics(columns, start_date, end_date)
+        
+        # Validate audio file paths
+        if 'audio_file' in df.columns:
+            df['audio_file'] = df['audio_file'].map(open_audio_index(AUDIO_DIR).valid_path)
+        
+        return df
+    except Exception as e:
+        st.error(f"Error loading analytics data: {str(e)}")
+        return pd.DataFrame(columns=columns or EXPECTED_COLUMNS)
+
 def load_deleted_entries() -> pd.DataFrame:
     """Load deleted entries with validation"""
     try:
-        if not os.path.exists(DELETED_ENTRIES_FILE) or os.path.getsize(DELETED_ENTRIES_FILE) == 0:
-            return pd.DataFrame(columns=EXPECTED_COLUMNS)
-            
-        df = pd.read_csv(DELETED_ENTRIES_FILE)
-        
-        # Ensure all expected columns exist
-        for col in EXPECTED_COLUMNS:
-            if col not in df.columns:
-                df[col] = None
+        df = open_store(DATABASE_FILE).load(deleted=True)
                 
         return df
     except Exception as e:
         st.error(f"Error loading deleted entries: {str(e)}")
         return pd.DataFrame(columns=EXPECTED_COLUMNS)
 
-def delete_submission(index: int, permanent: bool = False) -> bool:
+def load_archived_data(start_date=None, end_date=None) -> pd.DataFrame:
+    """Load archived submissions, active and deleted, optionally only some submission dates"""
+    try:
+        return open_store(DATABASE_FILE).load_archived(start_date=start_date, end_date=end_date)
+    except Exception as e:
+        st.error(f"Error loading archived submissions: {str(e)}")
+        return pd.DataFrame(columns=EXPECTED_COLUMNS)
+
+def delete_submission(submission_id: str, permanent: bool = False) -> bool:
     """Delete submission with proper file handling"""
     try:
-        df = load_submissions()
-        if index < 0 or index >= len(df):
-            st.error("Invalid entry index")
+        store = open_store(DATABASE_FILE)
+        
+        # Flag the row as deleted (or drop it outright) by its stable ID
+        if permanent:
+            row_to_delete = store.purge(submission_id)
+        else:
+            row_to_delete = store.soft_delete(submission_id)
+        
+        if row_to_delete is None:
+            st.error("Entry not found - it may already have been changed")
             return False
-
-        # Get the actual row before any modifications
-        row_to_delete = df.iloc[index].copy()
         
         # Handle audio file cleanup
         audio_file = row_to_delete['audio_file']
-        if audio_file and isinstance(audio_file, str) and os.path.exists(audio_file):
-            if permanent:
-                try:
-                    os.remove(audio_file)
-                except Exception as e:
-                    st.error(f"Error deleting audio file: {str(e)}")
-
-        # Create backup in deleted entries if not permanent
-        if not permanent:
-            deleted_df = load_deleted_entries()
-            deleted_df = pd.concat([deleted_df, pd.DataFrame([row_to_delete])], ignore_index=True)
-            deleted_df.to_csv(DELETED_ENTRIES_FILE, index=False)
-            os.chmod(DELETED_ENTRIES_FILE, 0o666)
-
-        # Remove from main file
-        df = df.drop(index).reset_index(drop=True)
-        df.to_csv(SUBMISSIONS_FILE, index=False)
-        os.chmod(SUBMISSIONS_FILE, 0o666)
+        if permanent:
+            try:
+                open_audio_index(AUDIO_DIR).remove(audio_file)
+            except Exception as e:
+                st.error(f"Error deleting audio file: {str(e)}")
         
         return True
-        
+    
     except Exception as e:
         st.error(f"Deletion failed: {str(e)}")
         return False
 
-def restore_deleted_entry(index: int) -> bool:
+def restore_deleted_entry(submission_id: str) -> bool:
     """Restore a deleted entry"""
     try:
-        deleted_df = load_deleted_entries()
-        if index < 0 or index >= len(deleted_df):
-            st.error("Invalid entry index")
+        # Clear the deleted flag by stable ID
+        if open_store(DATABASE_FILE).restore(submission_id) is None:
+            st.error("Entry not found - it may already have been changed")
             return False
-            
-        entry = deleted_df.iloc[index].copy().to_dict()
-        
-        # Save to main submissions
-        if save_submission(entry):
-            # Remove from deleted entries
-            deleted_df = deleted_df.drop(index).reset_index(drop=True)
-            deleted_df.to_csv(DELETED_ENTRIES_FILE, index=False)
-            os.chmod(DELETED_ENTRIES_FILE, 0o666)
-            return True
+        return True
     except Exception as e:
         st.error(f"Error restoring entry: {str(e)}")
     return False
 
+def delete_submissions(submission_ids: List[str], permanent: bool = False) -> int:
+    """Delete several submissions in one storage transaction"""
+    try:
+        store = open_store(DATABASE_FILE)
+        
+        # One transaction for the whole batch instead of one per row
+        if permanent:
+            deleted_rows = store.purge_many(submission_ids)
+        else:
+            deleted_rows = store.soft_delete_many(submission_ids)
+        
+        # Handle audio file cleanup
+        for row in deleted_rows:
+            audio_file = row.get('audio_file')
+            if permanent:
+                try:
+                    open_audio_index(AUDIO_DIR).remove(audio_file)
+                except Exception as e:
+                    st.warning(f"Could not delete audio file: {str(e)}")
+        
+        return len(deleted_rows)
+    
+    except Exception as e:
+        st.error(f"Bulk deletion failed: {str(e)}")
+        return 0
+
+def restore_entries(submission_ids: List[str]) -> int:
+    """Restore several deleted entries in one storage transaction"""
+    try:
+        return len(open_store(DATABASE_FILE).restore_many(submission_ids))
+    except Exception as e:
+        st.error(f"Error restoring entries: {str(e)}")
+        return 0
+
 def generate_qr_code(data: str) -> Tuple[str, Image.Image]:
     """Generate QR code from data"""
     try:
@@ -552,33 +412,141 @@ def show_confirmation_dialog(action: str, count: int) -> bool:
                 return False
     return False
 
+def analytics_date_range(key: str) -> Tuple:
+    """Date range picker for analytics views, returned as (start_date, end_date)
+    
+    Filters on the submission timestamp, which analytics snapshots are
+    partitioned by, so only the months in range are read from disk.
+    """
+    today = datetime.now().date()
+    date_range = st.date_input(
+        "Submitted between",
+        value=(today - timedelta(days=ANALYTICS_DEFAULT_DAYS), today),
+        key=key,
+        help="Filters on when the feedback was submitted, not the visit date"
+    )
+    # A half-picked range covers its one day; a cleared one covers everything
+    return (date_range[0], date_range[-1]) if date_range else (None, None)
+
+def show_archive_browser() -> None:
+    """Search the cold archive on demand"""
+    with st.expander("🧊 Archived Submissions", expanded=False):
+        st.caption(
+            f"Submissions older than {RETENTION_DAYS} days and entries deleted more than "
+            f"{DELETED_GRACE_DAYS} days ago are kept here, outside the live data."
+        )
+        date_range = st.date_input("Submitted between", value=[], key="archive_dates")
+        
+        # The archive is only read when asked for
+        if st.checkbox("Search archive", key="archive_search"):
+            start_date, end_date = date_range if len(date_range) == 2 else (None, None)
+            archived_df = load_archived_data(start_date, end_date)
+            
+            if archived_df.empty:
+                st.info("No archived submissions found.")
+            else:
+                st.write(f"Found {len(archived_df)} archived submissions")
+                st.dataframe(archived_df, use_container_width=True)
+                st.download_button(
+                    label="Download CSV",
+                    data=archived_df.to_csv(index=False).encode('utf-8'),
+                    file_name=f"play_africa_archived_feedback_{datetime.now().strftime('%Y%m%d')}.csv",
+                    mime='text/csv',
+                    key="archive_download"
+                )
+
+def show_point_in_time_restore() -> None:
+    """Rebuild the submissions as they were at an earlier moment"""
+    with st.expander("⏪ Point-in-Time Restore", expanded=False):
+        st.caption("Rebuilds every entry as it was at the chosen moment from the nearest backup and the change log.")
+        col1, col2 = st.columns(2)
+        with col1:
+            restore_date = st.date_input("Restore to date", value=datetime.now().date(), key="pitr_date")
+        with col2:
+            restore_time = st.time_input("Time", value=datetime.now().time().replace(second=0, microsecond=0), key="pitr_time")
+        
+        if st.button("🔎 Rebuild entries at this time", key="pitr_rebuild"):
+            target = datetime.combine(restore_date, restore_time)
+            # Each rebuild is a full plaintext copy; only the latest one is kept
+            previous = st.session_state.pop("pitr_restore", None)
+            if previous and os.path.exists(previous[0]):
+                os.remove(previous[0])
+            restore_path = new_restore_path(BACKUP_DIR, target)
+            try:
+                count = restore_to_time(open_store(DATABASE_FILE), BACKUP_DIR, target, restore_path)
+                st.session_state.pitr_restore = (restore_path, target.strftime('%Y-%m-%d %H:%M'), count)
+            except Exception as e:
+                st.error(f"Restore failed: {str(e)}")
+        
+        if st.session_state.get("pitr_restore"):
+            restore_path, restored_at, count = st.session_state.pitr_restore
+            if os.path.exists(restore_path):
+                st.write(f"Rebuilt {count} entries as of {restored_at}")
+                with open(restore_path, "rb") as f:
+                    st.download_button(
+                        label="Download CSV",
+                        data=f,
+                        file_name=os.path.basename(restore_path),
+                        mime='text/csv',
+                        key="pitr_download"
+                    )
+                
+                if st.button("↩️ Recover entries lost or deleted since then", key="pitr_recover"):
+                    try:
+                        rows = read_submissions_csv(restore_path).to_dict("records")
+                        recovered = open_store(DATABASE_FILE).recover(rows)
+                        os.remove(restore_path)
+                        del st.session_state.pitr_restore
+                        st.success(f"Recovered {recovered} entries")
+                    except Exception as e:
+                        st.error(f"Recovery failed: {str(e)}")
+
 def play_audio(filename: str) -> None:
     """Play audio with validation and download option"""
     try:
-        if not filename or not isinstance(filename, str) or not os.path.exists(filename):
+        if not isinstance(filename, str) or not filename or not open_audio_index(AUDIO_DIR).contains(filename):
             st.warning("No valid audio file available")
             return
-            
-        # Verify it's a WAV file
-        if not filename.lower().endswith('.wav'):
-            st.error("Invalid audio format - only WAV files supported")
+        
+        # Verify it's a format browsers can play
+        mime = audio_mime_type(filename)
+        if mime is None:
+            st.error("Invalid audio format - unsupported recording type")
             return
-
+        
+        # Stream from the audio server so the page only carries a signed URL
+        server = start_audio_server(AUDIO_DIR, AUDIO_SERVER_PORT, AUDIO_URL_KEY_FILE, AUDIO_PUBLIC_URL)
+        url = server.url_for(filename) if server else None
+        if url:
+            st.audio(url, format=mime)
+            st.link_button("Download Recording", f"{url}&download=1")
+            return
+        
         # Display audio player
         audio_bytes = open(filename, 'rb').read()
-        st.audio(audio_bytes, format='audio/wav')
+        st.audio(audio_bytes, format=mime)
         
         # Add download button
         st.download_button(
             label="Download Recording",
             data=audio_bytes,
             file_name=os.path.basename(filename),
-            mime="audio/wav",
+            mime=mime,
             key=f"dl_{filename}"
         )
     except Exception as e:
         st.error(f"Error playing audio: {str(e)}")
 
+def lazy_play_audio(filename: str) -> None:
+    """Show a load button that only reads the recording once an admin asks for it"""
+    # Expander bodies run even when collapsed, so players are opt-in per recording
+    loaded = st.session_state.setdefault('loaded_recordings', set())
+    if filename not in loaded:
+        if not st.button("▶️ Load recording", key=f"load_audio_{filename}"):
+            return
+        loaded.add(filename)
+    play_audio(filename)
+
 def authenticate() -> bool:
     """Handle user authentication"""
     if 'authenticated' not in st.session_state:
@@ -828,7 +796,7 @@ def show_feedback() -> None:
     
     if st.session_state.get('audio_file'):
         try:
-            st.audio(st.session_state.audio_file, format='audio/wav')
+            st.audio(st.session_state.audio_file, format=audio_mime_type(st.session_state.audio_file))
         except Exception as e:
             st.error(f"Error playing recording: {str(e)}")
 
@@ -977,15 +945,13 @@ def show_feedback() -> None:
                     "learning": ratings["Relevance of activities to children's learning"],
                     "planning": ratings["Planning and communication before the visit"],
                     "safety_space": ratings["Physical safety and comfort of the space"],
-                    "comments": json.dumps({
-                        "enjoyed": q1,
-                        "curiosity": q2,
-                        "support_goals": q3,
-                        "improve": q4,
-                        "recommend": q5,
-                        "future_topics": future_topics,
-                        "collaboration": future_collab
-                    }),
+                    "enjoyed": q1,
+                    "curiosity": q2,
+                    "support_goals": q3,
+                    "improve": q4,
+                    "recommend": q5,
+                    "future_topics": future_topics,
+                    "collaboration": future_collab,
                     "audio_file": audio_file_path,
                     "device_type": "mobile" if is_mobile() else "desktop"
                 }
@@ -1019,9 +985,6 @@ def show_dashboard() -> None:
     colors = get_theme_colors()
     st.markdown(f"<h1 style='color:{colors['text']}'>Feedback Dashboard</h1>", unsafe_allow_html=True)
     
-    if create_backup():
-        st.toast("Backup created successfully", icon="✅")
-    
     st.markdown(f"<h2 style='color:{colors['text']}'>Feedback Management</h2>", unsafe_allow_html=True)
     
     tab1, tab2 = st.tabs(["Active Feedback", "Deleted Feedback"])
@@ -1052,7 +1015,7 @@ def show_dashboard() -> None:
                 except:
                     pass
             
-            display_df['Index'] = df.index
+            display_df['ID'] = df.index
             
             page_size = st.selectbox('Rows per page', [5, 10, 20, 50], index=1, key='active_page_size')
             page_number = st.number_input('Page', min_value=1, max_value=max(1, len(display_df)//page_size + 1), 
@@ -1062,37 +1025,34 @@ def show_dashboard() -> None:
             
             table_data = display_df.iloc[start_idx:end_idx] if not display_df.empty else display_df
             
-            delete_indices = []
+            delete_ids = []
             for idx, row in table_data.iterrows():
                 with st.expander(f"{row['Date']} - {row['Submitted by']}"):
                     st.write(f"Group Type: {row['Group Type']}")
                     st.write(f"Children: {row['Children']} (ages {row['Ages']})")
                     st.write(f"Adults: {row['Adults']}")
                     
-                    audio_file = df.loc[row['Index'], 'audio_file'] if 'audio_file' in df.columns else None
-                    if audio_file and isinstance(audio_file, str) and os.path.exists(audio_file):
+                    audio_file = df.loc[row['ID'], 'audio_file'] if 'audio_file' in df.columns else None
+                    if open_audio_index(AUDIO_DIR).contains(audio_file):
                         st.markdown("**Children's Voice Recording:**")
-                        play_audio(audio_file)
+                        lazy_play_audio(audio_file)
                     else:
                         st.markdown("**No voice recording available for this submission**")
                     
                     col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("🗑️ Delete", key=f"del_{row['Index']}"):
-                            delete_indices.append(row['Index'])
+                        if st.button("🗑️ Delete", key=f"del_{row['ID']}"):
+                            delete_ids.append(row['ID'])
                     with col2:
-                        if st.button("💀 Permanent Delete", key=f"perm_del_{row['Index']}"):
+                        if st.button("💀 Permanent Delete", key=f"perm_del_{row['ID']}"):
                             if show_confirmation_dialog("Permanent Delete", 1):
-                                if delete_submission(row['Index'], permanent=True):
+                                if delete_submission(row['ID'], permanent=True):
                                     st.success("Entry permanently deleted")
                                     st.rerun()
             
-            if delete_indices:
-                if show_confirmation_dialog("Delete", len(delete_indices)):
-                    success_count = 0
-                    for index in sorted(delete_indices, reverse=True):
-                        if delete_submission(index):
-                            success_count += 1
+            if delete_ids:
+                if show_confirmation_dialog("Delete", len(delete_ids)):
+                    success_count = delete_submissions(delete_ids)
                     
                     if success_count > 0:
                         st.success(f"Successfully deleted {success_count} feedback submission(s)")
@@ -1101,6 +1061,9 @@ def show_dashboard() -> None:
                         st.error("No submissions were deleted")
     
     with tab2:
+        show_archive_browser()
+        show_point_in_time_restore()
+        
         deleted_df = load_deleted_entries()
         if not deleted_df.empty:
             deleted_display = deleted_df[['timestamp', 'school', 'group_type']].copy()
@@ -1116,7 +1079,7 @@ def show_dashboard() -> None:
                 except:
                     pass
             
-            deleted_display['Index'] = deleted_df.index
+            deleted_display['ID'] = deleted_df.index
             
             deleted_page_size = st.selectbox('Rows per page', [5, 10], index=0, key='deleted_page_size')
             deleted_page_number = st.number_input('Page', min_value=1, 
@@ -1127,35 +1090,32 @@ def show_dashboard() -> None:
             
             deleted_table_data = deleted_display.iloc[deleted_start_idx:deleted_end_idx]
             
-            restore_indices = []
+            restore_ids = []
             for idx, row in deleted_table_data.iterrows():
                 with st.expander(f"{row['Date']} - {row['Submitted by']}"):
                     st.write(f"Group Type: {row['Group Type']}")
                     
-                    audio_file = deleted_df.loc[row['Index'], 'audio_file'] if 'audio_file' in deleted_df.columns else None
-                    if audio_file and isinstance(audio_file, str) and os.path.exists(audio_file):
+                    audio_file = deleted_df.loc[row['ID'], 'audio_file'] if 'audio_file' in deleted_df.columns else None
+                    if open_audio_index(AUDIO_DIR).contains(audio_file):
                         st.markdown("**Children's Voice Recording:**")
-                        play_audio(audio_file)
+                        lazy_play_audio(audio_file)
                     else:
                         st.markdown("**No voice recording available for this submission**")
                     
                     col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("↩️ Restore", key=f"restore_{row['Index']}"):
-                            restore_indices.append(row['Index'])
+                        if st.button("↩️ Restore", key=f"restore_{row['ID']}"):
+                            restore_ids.append(row['ID'])
                     with col2:
-                        if st.button("💀 Permanent Delete", key=f"perm_del_deleted_{row['Index']}"):
+                        if st.button("💀 Permanent Delete", key=f"perm_del_deleted_{row['ID']}"):
                             if show_confirmation_dialog("Permanent Delete", 1):
-                                if delete_submission(row['Index'], permanent=True):
+                                if delete_submission(row['ID'], permanent=True):
                                     st.success("Entry permanently deleted")
                                     st.rerun()
             
-            if restore_indices:
-                if show_confirmation_dialog("Restore", len(restore_indices)):
-                    success_count = 0
-                    for index in sorted(restore_indices, reverse=True):
-                        if restore_deleted_entry(index):
-                            success_count += 1
+            if restore_ids:
+                if show_confirmation_dialog("Restore", len(restore_ids)):
+                    success_count = restore_entries(restore_ids)
                     
                     if success_count > 0:
                         st.success(f"Successfully restored {success_count} submission(s)")
@@ -1167,14 +1127,12 @@ def show_dashboard() -> None:
     
     st.markdown(f"<h2 style='color:{colors['text']}'>Feedback Analytics</h2>", unsafe_allow_html=True)
     
-    df = load_submissions()
+    start_date, end_date = analytics_date_range("analytics_dates")
+    rating_columns = ["engagement", "safety", "cleanliness", "fun", "learning", "planning", "safety_space"]
+    df = load_analytics_data(rating_columns, start_date, end_date)
     if not df.empty:
-        rating_columns = ["engagement", "safety", "cleanliness", "fun", "learning", "planning", "safety_space"]
-        for col in rating_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            else:
-                df[col] = 0
+        # Ratings are already small ints; unanswered ones count as 0 here
+        df = df.fillna(0)
 
         total = len(df)
         categories_labels = [
@@ -1368,6 +1326,8 @@ def show_dashboard() -> None:
             )
             
             st.altair_chart(pie_chart, use_container_width=True)
+    else:
+        st.info("No feedback submitted in the selected period.")
 
     st.markdown(f"<h2 style='color:{colors['text']}'>Data Export</h2>", unsafe_allow_html=True)
     
@@ -1520,27 +1480,6 @@ def main() -> None:
     if 'audio_file' not in st.session_state:
         st.session_state.audio_file = None
 
-    # JavaScript message handler for audio recorder
-    st.markdown("""
-    <script>
-    window.addEventListener('message', function(event) {
-        if (event.data.type === 'audioData') {
-            window.parent.streamlitBridge.setComponentValue({
-                [`audio_data_${event.data.componentKey}`]: event.data.data,
-                [`audio_filename_${event.data.componentKey}`]: event.data.filename,
-                [`audio_error_${event.data.componentKey}`]: null
-            });
-        }
-        if (event.data.type === 'streamlitError') {
-            window.parent.streamlitBridge.setComponentValue({
-                [`audio_data_${event.data.componentKey}`]: null,
-                [`audio_error_${event.data.componentKey}`]: event.data.error
-            });
-        }
-    });
-    </script>
-    """, unsafe_allow_html=True)
-
     # Handle authentication
     if not authenticate():
         return
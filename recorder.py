@@ -0,0 +1,64 @@
+"""Streaming voice recorder component for the Play Africa feedback apps
+
+The browser side (``recorder_frontend/index.html``) uploads the recording
+as binary frames while it is being made, instead of posting one base64
+string at the end. Each frame arrives as the component's bytes value; an
+``on_change`` callback appends it to the recording on disk before the
+script reruns, and the rerun hands the acknowledgement back to the
+browser as a render argument so it can send the next frame.
+"""
+import json
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from audio_store import write_recording_frame
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorder_frontend")
+_recorder_component = components.declare_component("streaming_audio_recorder", path=_FRONTEND_DIR)
+
+
+def parse_frame(frame: bytes) -> Tuple[Dict, memoryview]:
+    """Split a ``[u32 header length][JSON header][payload]`` frame"""
+    view = memoryview(frame)
+    if len(view) < 4:
+        raise ValueError("Truncated recording frame")
+    (header_length,) = struct.unpack(">I", view[:4])
+    if len(view) < 4 + header_length:
+        raise ValueError("Truncated recording frame")
+    header = json.loads(bytes(view[4:4 + header_length]))
+    return header, view[4 + header_length:]
+
+
+def streaming_recorder(audio_dir: str, key: str = "audio_recorder", max_seconds: int = 30) -> Optional[str]:
+    """Render the recorder, returning the path of a recording finished since the last run"""
+    ack_key = f"{key}_ack"
+    saved_key = f"{key}_saved"
+
+    def receive_frame() -> None:
+        frame = st.session_state.get(key)
+        if not frame:
+            return
+        ack = {"recording_id": None, "seq": None}
+        try:
+            header, payload = parse_frame(bytes(frame))
+            ack.update(recording_id=header.get("recording_id"), seq=header.get("seq"))
+            written, path = write_recording_frame(audio_dir, header, payload)
+            ack.update(ack=written, done=bool(header.get("final")) and written == header.get("total"))
+            if path is not None:
+                st.session_state[saved_key] = path
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            ack["error"] = str(e)
+        st.session_state[ack_key] = ack
+
+    _recorder_component(
+        key=key,
+        ack=st.session_state.get(ack_key),
+        max_seconds=max_seconds,
+        default=None,
+        on_change=receive_frame,
+    )
+    return st.session_state.pop(saved_key, None)
@@ -0,0 +1,116 @@
+"""Cross-process file locking and atomic file writes
+
+Several Streamlit worker processes can share one ``data/`` volume. Any
+read-modify-write of a shared file holds an advisory lock on a sidecar
+``<file>.lock``, and new contents are written to a temporary file in the
+same directory and moved into place with ``os.replace``, so readers see
+either the old file or the new one and never a half-written one.
+"""
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, IO, Iterator
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive advisory lock for ``path`` across processes"""
+    lock_path = f"{path}.lock"
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    # Blocks for about 10 seconds before raising
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: str) -> None:
+    if fcntl is None:
+        # Directories cannot be opened for fsync on Windows
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w", permissions: int = 0o666, **kwargs) -> Iterator[IO]:
+    """Write ``path`` through a temporary file that replaces it on success
+
+    The file ends up with ``permissions``; the default lets every worker
+    process rewrite it, whichever user it runs as.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
+
+
+def write_csv(path: str, df: pd.DataFrame) -> None:
+    """Atomically replace ``path`` with ``df`` as CSV"""
+    with atomic_write(path, newline="") as f:
+        df.to_csv(f, index=False)
+
+
+def write_json(path: str, data: Dict, **kwargs) -> None:
+    """Atomically replace ``path`` with ``data`` as JSON"""
+    with atomic_write(path) as f:
+        json.dump(data, f, **kwargs)
+
+
+def update_csv(path: str, update: Callable[[pd.DataFrame], pd.DataFrame]) -> pd.DataFrame:
+    """Locked read-modify-write of a CSV, returning the written frame
+
+    ``update`` receives the current full contents, so changes made by
+    other processes since the caller last read the file are kept. Values
+    are read as text so rewriting never alters them (e.g. phone numbers
+    keep their leading zero).
+    """
+    with file_lock(path):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        else:
+            df = pd.DataFrame()
+        df = update(df)
+        write_csv(path, df)
+    return df
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from streamlit_lottie import st_lottie
 import altair as alt
@@ -11,49 +11,93 @@ import qrcode
 import base64
 from io import BytesIO
 import hashlib
-import shutil
-from typing import Optional, Tuple
-from streamlit.components.v1 import html
+from typing import List, Optional, Tuple
 import platform
 
+from audio_server import start_audio_server
+from audio_store import audio_mime_type, clear_recordings, open_audio_index
+from backups import new_restore_path, prune_restores, restore_to_time, snapshot_media, start_backup_scheduler, verify_backup, write_backup
+from recorder import streaming_recorder
+from safe_io import file_lock, write_json
+from storage import SUBMISSION_COLUMNS, open_store, read_submissions_csv
+from transcode import start_transcoder
+
 # Constants - using absolute paths for reliability
 DATA_DIR = os.path.abspath("data")
-SUBMISSIONS_FILE = os.path.join(DATA_DIR, "submissions.csv")
+DATABASE_FILE = os.path.join(DATA_DIR, "feedback.db")
 AUDIO_DIR = os.path.join(DATA_DIR, "audio")
 BACKUP_DIR = os.path.join(DATA_DIR, "backups")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+
+# Legacy CSV storage, imported into DATABASE_FILE on first start
+SUBMISSIONS_FILE = os.path.join(DATA_DIR, "submissions.csv")
+SUBMISSIONS_LOG_FILE = os.path.join(DATA_DIR, "submissions.log")
 DELETED_ENTRIES_FILE = os.path.join(DATA_DIR, "deleted_entries.csv")
 
+# Retention: submissions older than this, and entries deleted longer ago than
+# the grace period, move to the cold archive (None keeps them in the database)
+RETENTION_DAYS = 365
+DELETED_GRACE_DAYS = 30
+
+# Analytics views open on this many days of submissions
+ANALYTICS_DEFAULT_DAYS = 90
+
+# Scheduled backups: how often (seconds) to check for changes, and how many to keep
+BACKUP_INTERVAL = 15 * 60
+BACKUP_KEEP = 96
+
+# Media backed up alongside the data, by content hash
+MEDIA_BACKUP_SOURCES = {"audio": os.path.join(AUDIO_DIR, "*")}
+
+# Recordings are transcoded to mono Opus in the background: how often
+# (seconds) to look for new ones, and how many ffmpeg processes to run
+TRANSCODE_INTERVAL = 30
+TRANSCODE_WORKERS = 2
+
+# Recordings are streamed to browsers by a small HTTP server with range
+# requests when AUDIO_SERVER_PORT is set; AUDIO_PUBLIC_URL is the address
+# browsers reach it on (e.g. behind a reverse proxy). With no port, as on
+# Streamlit Cloud, recordings are handed to Streamlit instead.
+AUDIO_SERVER_PORT = int(os.environ.get("AUDIO_SERVER_PORT", "0"))
+AUDIO_PUBLIC_URL = os.environ.get("AUDIO_PUBLIC_URL")
+AUDIO_URL_KEY_FILE = os.path.join(DATA_DIR, "audio_url.key")
+
 # Ensure directories exist with proper permissions
 os.makedirs(DATA_DIR, exist_ok=True, mode=0o777)
 os.makedirs(AUDIO_DIR, exist_ok=True, mode=0o777)
 os.makedirs(BACKUP_DIR, exist_ok=True, mode=0o777)
 
 # Define expected columns for submissions
-EXPECTED_COLUMNS = [
-    'timestamp', 'school', 'group_type', 'children_no', 'children_age',
-    'adults_present', 'visit_date', 'programme', 'engagement', 'safety',
-    'cleanliness', 'fun', 'learning', 'planning', 'safety_space',
-    'comments', 'audio_file', 'device_type'
-]
+EXPECTED_COLUMNS = SUBMISSION_COLUMNS
 
 def initialize_data_files():
     """Initialize data files with proper structure and permissions"""
     try:
-        # Initialize submissions file
-        if not os.path.exists(SUBMISSIONS_FILE) or os.path.getsize(SUBMISSIONS_FILE) == 0:
-            pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(SUBMISSIONS_FILE, index=False)
-            os.chmod(SUBMISSIONS_FILE, 0o666)
-
-        # Initialize deleted entries file
-        if not os.path.exists(DELETED_ENTRIES_FILE) or os.path.getsize(DELETED_ENTRIES_FILE) == 0:
-            pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(DELETED_ENTRIES_FILE, index=False)
-            os.chmod(DELETED_ENTRIES_FILE, 0o666)
-
-        # Initialize users file
-        if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
-            with open(USERS_FILE, "w") as f:
-                json.dump({
+        # Import legacy CSV files into the database (no-op once migrated)
+        open_store(DATABASE_FILE).migrate_from_csv(
+            SUBMISSIONS_FILE, DELETED_ENTRIES_FILE, SUBMISSIONS_LOG_FILE, BACKUP_DIR
+        )
+
+        # Move old and long-deleted rows to the cold archive (checked hourly)
+        open_store(DATABASE_FILE).apply_retention(RETENTION_DAYS, DELETED_GRACE_DAYS)
+
+        # Back up in the background whenever the data has changed
+        start_backup_scheduler(
+            open_store(DATABASE_FILE), BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, media=MEDIA_BACKUP_SOURCES
+        )
+        # Restores used to be written to data/restores and never deleted
+        prune_restores(DATA_DIR)
+
+        # Shrink new recordings off the request path (skipped without ffmpeg)
+        start_transcoder(open_store(DATABASE_FILE), AUDIO_DIR, TRANSCODE_INTERVAL, TRANSCODE_WORKERS)
+
+        # Serve recordings over HTTP with range support (if configured)
+        start_audio_server(AUDIO_DIR, AUDIO_SERVER_PORT, AUDIO_URL_KEY_FILE, AUDIO_PUBLIC_URL)
+
+        # Initialize users file; the lock stops two workers both creating it
+        with file_lock(USERS_FILE):
+            if not os.path.exists(USERS_FILE) or os.path.getsize(USERS_FILE) == 0:
+                write_json(USERS_FILE, {
                     "admin": {
                         "password": hashlib.sha256("Playafrica@2025!*".encode()).hexdigest(),
                         "role": "admin"
@@ -62,8 +106,7 @@ def initialize_data_files():
                         "password": hashlib.sha256("Guest@2025".encode()).hexdigest(),
                         "role": "Guest"
                     }
-                }, f)
-            os.chmod(USERS_FILE, 0o666)
+                })
     except Exception as e:
         st.error(f"Initialization error: {str(e)}")
 
@@ -71,7 +114,7 @@ def initialize_data_files():
 initialize_data_files()
 
 def audio_recorder():
-    """Audio recorder component that works in Streamlit Cloud"""
+    """Audio recorder that streams the recording into AUDIO_DIR while it is made"""
     # Initialize session state for audio recording
     if 'audio_data' not in st.session_state:
         st.session_state.audio_data = None
@@ -80,156 +123,20 @@ def audio_recorder():
     if 'recording_saved' not in st.session_state:
         st.session_state.recording_saved = False
 
-    # Generate a unique key for this component instance
-    component_key = f"audio_recorder_{hash(str(st.session_state))}"
-
-    # HTML and JavaScript for the audio recorder
-    html_code = f"""
-    <div id="audio-recorder-{component_key}" style="margin: 10px 0; font-family: Arial, sans-serif;">
-        <button id="start-btn-{component_key}" onclick="startRecording_{component_key}()" 
-                style="padding: 8px 16px; margin-right: 10px; background-color: #2E86AB; color: white; border: none; border-radius: 4px; cursor: pointer;">
-            🎤 Start Recording
-        </button>
-        <button id="stop-btn-{component_key}" onclick="stopRecording_{component_key}()" 
-                style="padding: 8px 16px; background-color: #F18F01; color: white; border: none; border-radius: 4px; cursor: pointer;" disabled>
-            ⏹️ Stop Recording
-        </button>
-        <p id="status-{component_key}" style="margin-top: 10px; font-size: 14px; color: #555;">
-            Ready to record (max 30 seconds)
-        </p>
-        <div id="preview-container-{component_key}" style="display: none; margin-top: 15px; padding: 10px; background-color: #f5f5f5; border-radius: 5px;">
-            <p style="font-size: 14px; margin-bottom: 5px; font-weight: bold;">Your Recording:</p>
-            <audio id="audio-preview-{component_key}" controls style="width: 100%;"></audio>
-        </div>
-    </div>
-
-    <script>
-    (function() {{
-        let recorder_{component_key} = null;
-        let audioChunks_{component_key} = [];
-        let stream_{component_key} = null;
-
-        window.startRecording_{component_key} = async function() {{
-            try {{
-                audioChunks_{component_key} = [];
-                stream_{component_key} = await navigator.mediaDevices.getUserMedia({{ audio: true }});
-                recorder_{component_key} = new MediaRecorder(stream_{component_key});
-
-                recorder_{component_key}.ondataavailable = function(e) {{
-                    if (e.data.size > 0) {{
-                        audioChunks_{component_key}.push(e.data);
-                    }}
-                }};
-
-                recorder_{component_key}.onstop = async function() {{
-                    try {{
-                        if (audioChunks_{component_key}.length === 0) {{
-                            throw new Error("No audio data recorded");
-                        }}
-
-                        const audioBlob = new Blob(audioChunks_{component_key}, {{ type: 'audio/wav' }});
-                        const arrayBuffer = await audioBlob.arrayBuffer();
-                        const base64Data = arrayBufferToBase64(arrayBuffer);
-                        const filename = 'recording_' + new Date().getTime() + '.wav';
-
-                        // Create preview
-                        const audioUrl = URL.createObjectURL(audioBlob);
-                        document.getElementById('audio-preview-{component_key}').src = audioUrl;
-                        document.getElementById('preview-container-{component_key}').style.display = 'block';
-
-                        // Send data to Streamlit
-                        window.parent.postMessage({{
-                            type: 'streamlit:setComponentValue',
-                            value: {{
-                                audio_data: base64Data,
-                                filename: filename,
-                                timestamp: new Date().getTime()
-                            }}
-                        }}, '*');
-
-                        document.getElementById('status-{component_key}').innerText = 'Recording complete - ready to submit';
-                        document.getElementById('start-btn-{component_key}').disabled = false;
-                        document.getElementById('stop-btn-{component_key}').disabled = true;
-                    }} catch (error) {{
-                        console.error('Processing error:', error);
-                        document.getElementById('status-{component_key}').innerText = 'Error processing recording';
-                    }} finally {{
-                        if (stream_{component_key}) {{
-                            stream_{component_key}.getTracks().forEach(track => track.stop());
-                        }}
-                    }}
-                }};
-
-                recorder_{component_key}.start(100);
-                document.getElementById('status-{component_key}').innerText = 'Recording... (Max 30 seconds)';
-                document.getElementById('start-btn-{component_key}').disabled = true;
-                document.getElementById('stop-btn-{component_key}').disabled = false;
-                document.getElementById('preview-container-{component_key}').style.display = 'none';
-
-                // Auto-stop after 30 seconds
-                setTimeout(() => {{
-                    if (recorder_{component_key} && recorder_{component_key}.state === 'recording') {{
-                        recorder_{component_key}.stop();
-                    }}
-                }}, 30000);
-
-            }} catch (error) {{
-                console.error('Recording error:', error);
-                document.getElementById('status-{component_key}').innerText = 'Error: ' + error.message;
-            }}
-        }};
-
-        window.stopRecording_{component_key} = function() {{
-            if (recorder_{component_key} && recorder_{component_key}.state === 'recording') {{
-                recorder_{component_key}.stop();
-            }}
-        }};
-
-        function arrayBufferToBase64(buffer) {{
-            let binary = '';
-            const bytes = new Uint8Array(buffer);
-            for (let i = 0; i < bytes.byteLength; i++) {{
-                binary += String.fromCharCode(bytes[i]);
-            }}
-            return window.btoa(binary);
-        }}
-    }})();
-    </script>
-    """
-
-    # Render the component and get the returned value
-    component_value = html(html_code, height=200)
-
-    # Process the audio data if received
-    if component_value and isinstance(component_value, dict):
-        if 'audio_data' in component_value and component_value['audio_data']:
-            try:
-                # Decode and save the audio data
-                audio_bytes = base64.b64decode(component_value['audio_data'])
-                filename = f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{component_value.get('timestamp', '')}.wav"
-                audio_path = os.path.join(AUDIO_DIR, filename)
-
-                # Ensure audio directory exists
-                os.makedirs(AUDIO_DIR, exist_ok=True, mode=0o777)
-
-                # Save the audio file
-                with open(audio_path, "wb") as f:
-                    f.write(audio_bytes)
-
-                # Set proper permissions
-                os.chmod(audio_path, 0o666)
-
-                # Store in session state
-                st.session_state.audio_data = audio_path
-                st.session_state.audio_filename = filename
-                st.session_state.recording_saved = True
-
-                st.success("✅ Recording saved successfully!")
-            except Exception as e:
-                st.error(f"Error saving recording: {str(e)}")
-                st.session_state.audio_data = None
-                st.session_state.audio_filename = None
-                st.session_state.recording_saved = False
+    try:
+        audio_path = streaming_recorder(AUDIO_DIR, key="audio_recorder", max_seconds=30)
+        if audio_path:
+            # Store in session state
+            st.session_state.audio_data = audio_path
+            st.session_state.audio_filename = os.path.basename(audio_path)
+            st.session_state.recording_saved = True
+
+            st.success("✅ Recording saved successfully!")
+    except Exception as e:
+        st.error(f"Error saving recording: {str(e)}")
+        st.session_state.audio_data = None
+        st.session_state.audio_filename = None
+        st.session_state.recording_saved = False
 
 def is_mobile():
     """Detect if user is on a mobile device"""
@@ -274,22 +181,17 @@ def mobile_adjusted_text_area(label, value="", height=100, key=None, placeholder
     return st.text_area(label, value, height=height, key=key, placeholder=placeholder)
 
 def create_backup() -> bool:
-    """Create a backup of submissions with verification"""
+    """Create a backup of submissions now"""
     try:
-        if not os.path.exists(SUBMISSIONS_FILE):
-            return False
-        
-        os.makedirs(BACKUP_DIR, exist_ok=True, mode=0o777)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"backup_{timestamp}.csv")
-        
-        shutil.copy2(SUBMISSIONS_FILE, backup_path)
-        os.chmod(backup_path, 0o666)
-        
-        # Verify backup was created
-        if not os.path.exists(backup_path):
-            raise Exception("Backup file not created")
-        
+        backup_path = write_backup(open_store(DATABASE_FILE), BACKUP_DIR)
+
+        # Stream the backup through its checksum rather than trusting it exists
+        if not verify_backup(backup_path):
+            raise Exception("Backup failed verification")
+
+        # Recordings are stored once per distinct file, so this only copies new ones
+        snapshot_media(BACKUP_DIR, MEDIA_BACKUP_SOURCES)
+
         return True
     except Exception as e:
         st.error(f"Backup failed: {str(e)}")
@@ -315,25 +217,8 @@ def save_submission(entry: dict) -> bool:
         # Clean and validate data
         entry = {k: (v.strip() if isinstance(v, str) else v) for k, v in entry.items()}
 
-        # Load existing data
-        if os.path.exists(SUBMISSIONS_FILE) and os.path.getsize(SUBMISSIONS_FILE) > 0:
-            existing_df = pd.read_csv(SUBMISSIONS_FILE)
-            # Ensure all columns exist in the existing data
-            for col in EXPECTED_COLUMNS:
-                if col not in existing_df.columns:
-                    existing_df[col] = None
-        else:
-            existing_df = pd.DataFrame(columns=EXPECTED_COLUMNS)
-
-        # Create new DataFrame with the entry
-        new_df = pd.DataFrame([entry])
-
-        # Combine with existing data
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-
-        # Save to file
-        combined_df.to_csv(SUBMISSIONS_FILE, index=False)
-        os.chmod(SUBMISSIONS_FILE, 0o666)  # Ensure proper permissions
+        # Batched with concurrent submissions; returns once the batch is on disk
+        open_store(DATABASE_FILE).insert(entry)
 
         return True
     except Exception as e:
@@ -343,112 +228,126 @@ def save_submission(entry: dict) -> bool:
 def load_submissions() -> pd.DataFrame:
     """Load submissions with robust error handling"""
     try:
-        if not os.path.exists(SUBMISSIONS_FILE) or os.path.getsize(SUBMISSIONS_FILE) == 0:
-            return pd.DataFrame(columns=EXPECTED_COLUMNS)
-        
-        df = pd.read_csv(SUBMISSIONS_FILE)
-        
-        # Ensure all expected columns exist
-        for col in EXPECTED_COLUMNS:
-            if col not in df.columns:
-                df[col] = None
+        df = open_store(DATABASE_FILE).load()
         
         # Validate audio file paths
         if 'audio_file' in df.columns:
-            df['audio_file'] = df['audio_file'].apply(
-                lambda x: x if isinstance(x, str) and os.path.exists(x) else None
-            )
+            df['audio_file'] = df['audio_file'].map(open_audio_index(AUDIO_DIR).valid_path)
         
         return df
     except Exception as e:
         st.error(f"Error loading submissions: {str(e)}")
         return pd.DataFrame(columns=EXPECTED_COLUMNS)
 
+def load_analytics_data(columns: Optional[List[str]] = None, start_date=None, end_date=None) -> pd.DataFrame:
+    """Load typed submissions for analytics, optionally only some columns and submission dates"""
+    try:
+        df = open_store(DATABASE_FILE).load_analytics(columns, start_date, end_date)
+
+        # Validate audio file paths
+        if 'audio_file' in df.columns:
+            df['audio_file'] = df['audio_file'].map(open_audio_index(AUDIO_DIR).valid_path)
+
+        return df
+    except Exception as e:
+        st.error(f"Error loading analytics data: {str(e)}")
+        return pd.DataFrame(columns=columns or EXPECTED_COLUMNS)
+
 def load_deleted_entries() -> pd.DataFrame:
     """Load deleted entries with validation"""
     try:
-        if not os.path.exists(DELETED_ENTRIES_FILE) or os.path.getsize(DELETED_ENTRIES_FILE) == 0:
-            return pd.DataFrame(columns=EXPECTED_COLUMNS)
-        
-        df = pd.read_csv(DELETED_ENTRIES_FILE)
-        
-        # Ensure all expected columns exist
-        for col in EXPECTED_COLUMNS:
-            if col not in df.columns:
-                df[col] = None
+        df = open_store(DATABASE_FILE).load(deleted=True)
         
         return df
     except Exception as e:
         st.error(f"Error loading deleted entries: {str(e)}")
         return pd.DataFrame(columns=EXPECTED_COLUMNS)
 
-def delete_submission(index: int, permanent: bool = False) -> bool:
+def load_archived_data(start_date=None, end_date=None) -> pd.DataFrame:
+    """Load archived submissions, active and deleted, optionally only some submission dates"""
+    try:
+        return open_store(DATABASE_FILE).load_archived(start_date=start_date, end_date=end_date)
+    except Exception as e:
+        st.error(f"Error loading archived submissions: {str(e)}")
+        return pd.DataFrame(columns=EXPECTED_COLUMNS)
+
+def delete_submission(submission_id: str, permanent: bool = False) -> bool:
     """Delete submission with proper file handling"""
     try:
-        df = load_submissions()
-        if df.empty or index < 0 or index >= len(df):
-            st.error("Invalid entry index or no data available")
-            return False
+        store = open_store(DATABASE_FILE)
 
-        # Get the entry to be deleted
-        entry_to_delete = df.iloc[index].copy()
+        # Flag as deleted (or drop outright) by stable ID
+        if permanent:
+            entry_to_delete = store.purge(submission_id)
+        else:
+            entry_to_delete = store.soft_delete(submission_id)
+
+        if entry_to_delete is None:
+            st.error("Submission not found - it may already have been deleted")
+            return False
 
         # Handle audio file cleanup
         audio_file = entry_to_delete.get('audio_file')
-        if audio_file and isinstance(audio_file, str) and os.path.exists(audio_file):
-            if permanent:
-                try:
-                    os.remove(audio_file)
-                except Exception as e:
-                    st.warning(f"Could not delete audio file: {str(e)}")
-
-        # Move to deleted entries if not permanent deletion
-        if not permanent:
+        if permanent:
             try:
-                deleted_df = load_deleted_entries()
-                # Convert series to dataframe
-                entry_df = pd.DataFrame([entry_to_delete])
-                deleted_df = pd.concat([deleted_df, entry_df], ignore_index=True)
-                deleted_df.to_csv(DELETED_ENTRIES_FILE, index=False)
-                os.chmod(DELETED_ENTRIES_FILE, 0o666)
+                open_audio_index(AUDIO_DIR).remove(audio_file)
             except Exception as e:
-                st.error(f"Error moving to deleted entries: {str(e)}")
-                return False
-
-        # Remove from main submissions file
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        df.to_csv(SUBMISSIONS_FILE, index=False)
-        os.chmod(SUBMISSIONS_FILE, 0o666)
+                st.warning(f"Could not delete audio file: {str(e)}")
 
         return True
+
     except Exception as e:
         st.error(f"Deletion failed: {str(e)}")
         return False
 
-def restore_deleted_entry(index: int) -> bool:
+def restore_deleted_entry(submission_id: str) -> bool:
     """Restore a deleted entry"""
     try:
-        deleted_df = load_deleted_entries()
-        if deleted_df.empty or index < 0 or index >= len(deleted_df):
-            st.error("Invalid entry index or no deleted entries available")
+        # Clear the deleted flag by stable ID
+        if open_store(DATABASE_FILE).restore(submission_id) is None:
+            st.error("Deleted entry not found - it may already have been restored")
             return False
 
-        # Get the entry to restore
-        entry = deleted_df.iloc[index].to_dict()
+        return True
 
-        # Save to main submissions
-        if save_submission(entry):
-            # Remove from deleted entries
-            deleted_df = deleted_df.drop(deleted_df.index[index]).reset_index(drop=True)
-            deleted_df.to_csv(DELETED_ENTRIES_FILE, index=False)
-            os.chmod(DELETED_ENTRIES_FILE, 0o666)
-            return True
-        else:
-            return False
     except Exception as e:
         st.error(f"Error restoring entry: {str(e)}")
         return False
 
+def delete_submissions(submission_ids: List[str], permanent: bool = False) -> int:
+    """Delete several submissions in one storage transaction"""
+    try:
+        store = open_store(DATABASE_FILE)
+
+        # One transaction for the whole batch instead of one per row
+        if permanent:
+            deleted_rows = store.purge_many(submission_ids)
+        else:
+            deleted_rows = store.soft_delete_many(submission_ids)
+
+        # Handle audio file cleanup
+        for row in deleted_rows:
+            audio_file = row.get('audio_file')
+            if permanent:
+                try:
+                    open_audio_index(AUDIO_DIR).remove(audio_file)
+                except Exception as e:
+                    st.warning(f"Could not delete audio file: {str(e)}")
+
+        return len(deleted_rows)
+
+    except Exception as e:
+        st.error(f"Bulk deletion failed: {str(e)}")
+        return 0
+
+def restore_entries(submission_ids: List[str]) -> int:
+    """Restore several deleted entries in one storage transaction"""
+    try:
+        return len(open_store(DATABASE_FILE).restore_many(submission_ids))
+    except Exception as e:
+        st.error(f"Error restoring entries: {str(e)}")
+        return 0
+
 def generate_qr_code(data: str) -> Tuple[str, Image.Image]:
     """Generate QR code from data"""
     try:
@@ -531,33 +430,141 @@ def show_confirmation_dialog(action: str, count: int) -> bool:
                 return False
     return False
 
+def analytics_date_range(key: str) -> Tuple:
+    """Date range picker for analytics views, returned as (start_date, end_date)
+
+    Filters on the submission timestamp, which analytics snapshots are
+    partitioned by, so only the months in range are read from disk.
+    """
+    today = datetime.now().date()
+    date_range = st.date_input(
+        "Submitted between",
+        value=(today - timedelta(days=ANALYTICS_DEFAULT_DAYS), today),
+        key=key,
+        help="Filters on when the feedback was submitted, not the visit date"
+    )
+    # A half-picked range covers its one day; a cleared one covers everything
+    return (date_range[0], date_range[-1]) if date_range else (None, None)
+
+def show_archive_browser() -> None:
+    """Search the cold archive on demand"""
+    with st.expander("🧊 Archived Submissions", expanded=False):
+        st.caption(
+            f"Submissions older than {RETENTION_DAYS} days and entries deleted more than "
+            f"{DELETED_GRACE_DAYS} days ago are kept here, outside the live data."
+        )
+        date_range = st.date_input("Submitted between", value=[], key="archive_dates")
+
+        # The archive is only read when asked for
+        if st.checkbox("Search archive", key="archive_search"):
+            start_date, end_date = date_range if len(date_range) == 2 else (None, None)
+            archived_df = load_archived_data(start_date, end_date)
+
+            if archived_df.empty:
+                st.info("No archived submissions found.")
+            else:
+                st.write(f"Found {len(archived_df)} archived submissions")
+                st.dataframe(archived_df, use_container_width=True)
+                st.download_button(
+                    label="Download CSV",
+                    data=archived_df.to_csv(index=False).encode('utf-8'),
+                    file_name=f"play_africa_archived_feedback_{datetime.now().strftime('%Y%m%d')}.csv",
+                    mime='text/csv',
+                    key="archive_download"
+                )
+
+def show_point_in_time_restore() -> None:
+    """Rebuild the submissions as they were at an earlier moment"""
+    with st.expander("⏪ Point-in-Time Restore", expanded=False):
+        st.caption("Rebuilds every entry as it was at the chosen moment from the nearest backup and the change log.")
+        col1, col2 = st.columns(2)
+        with col1:
+            restore_date = st.date_input("Restore to date", value=datetime.now().date(), key="pitr_date")
+        with col2:
+            restore_time = st.time_input("Time", value=datetime.now().time().replace(second=0, microsecond=0), key="pitr_time")
+
+        if st.button("🔎 Rebuild entries at this time", key="pitr_rebuild"):
+            target = datetime.combine(restore_date, restore_time)
+            # Each rebuild is a full plaintext copy; only the latest one is kept
+            previous = st.session_state.pop("pitr_restore", None)
+            if previous and os.path.exists(previous[0]):
+                os.remove(previous[0])
+            restore_path = new_restore_path(BACKUP_DIR, target)
+            try:
+                count = restore_to_time(open_store(DATABASE_FILE), BACKUP_DIR, target, restore_path)
+                st.session_state.pitr_restore = (restore_path, target.strftime('%Y-%m-%d %H:%M'), count)
+            except Exception as e:
+                st.error(f"Restore failed: {str(e)}")
+
+        if st.session_state.get("pitr_restore"):
+            restore_path, restored_at, count = st.session_state.pitr_restore
+            if os.path.exists(restore_path):
+                st.write(f"Rebuilt {count} entries as of {restored_at}")
+                with open(restore_path, "rb") as f:
+                    st.download_button(
+                        label="Download CSV",
+                        data=f,
+                        file_name=os.path.basename(restore_path),
+                        mime='text/csv',
+                        key="pitr_download"
+                    )
+
+                if st.button("↩️ Recover entries lost or deleted since then", key="pitr_recover"):
+                    try:
+                        rows = read_submissions_csv(restore_path).to_dict("records")
+                        recovered = open_store(DATABASE_FILE).recover(rows)
+                        os.remove(restore_path)
+                        del st.session_state.pitr_restore
+                        st.success(f"Recovered {recovered} entries")
+                    except Exception as e:
+                        st.error(f"Recovery failed: {str(e)}")
+
 def play_audio(filename: str) -> None:
     """Play audio with validation and download option"""
     try:
-        if not filename or not isinstance(filename, str) or not os.path.exists(filename):
+        if not isinstance(filename, str) or not filename or not open_audio_index(AUDIO_DIR).contains(filename):
             st.warning("No valid audio file available")
             return
 
-        # Verify it's a WAV file
-        if not filename.lower().endswith('.wav'):
-            st.error("Invalid audio format - only WAV files supported")
+        # Verify it's a format browsers can play
+        mime = audio_mime_type(filename)
+        if mime is None:
+            st.error("Invalid audio format - unsupported recording type")
+            return
+
+        # Stream from the audio server so the page only carries a signed URL
+        server = start_audio_server(AUDIO_DIR, AUDIO_SERVER_PORT, AUDIO_URL_KEY_FILE, AUDIO_PUBLIC_URL)
+        url = server.url_for(filename) if server else None
+        if url:
+            st.audio(url, format=mime)
+            st.link_button("Download Recording", f"{url}&download=1")
             return
 
         # Display audio player
         audio_bytes = open(filename, 'rb').read()
-        st.audio(audio_bytes, format='audio/wav')
+        st.audio(audio_bytes, format=mime)
 
         # Add download button
         st.download_button(
             label="Download Recording",
             data=audio_bytes,
             file_name=os.path.basename(filename),
-            mime="audio/wav",
+            mime=mime,
             key=f"dl_{filename}"
         )
     except Exception as e:
         st.error(f"Error playing audio: {str(e)}")
 
+def lazy_play_audio(filename: str) -> None:
+    """Show a load button that only reads the recording once an admin asks for it"""
+    # Expander bodies run even when collapsed, so players are opt-in per recording
+    loaded = st.session_state.setdefault('loaded_recordings', set())
+    if filename not in loaded:
+        if not st.button("▶️ Load recording", key=f"load_audio_{filename}"):
+            return
+        loaded.add(filename)
+    play_audio(filename)
+
 def authenticate() -> bool:
     """Handle user authentication"""
     if 'authenticated' not in st.session_state:
@@ -755,6 +762,20 @@ def feedback_form():
 
     st.markdown('<div class="form-header"><h1>🎮 Play Africa Feedback Form</h1><p>Help us improve play experiences for children!</p></div>', unsafe_allow_html=True)
 
+    # Outside the form: the recorder streams while recording, and values
+    # of widgets inside a form are only sent when it is submitted
+    st.markdown("#### 🎤 Voice Recording (Optional)")
+    st.markdown("Record a voice message to share your thoughts:")
+    
+    # Audio recorder
+    audio_recorder()
+    
+    # Show recording status
+    if st.session_state.get('recording_saved', False):
+        st.success("✅ Voice recording ready for submission!")
+        if st.session_state.get('audio_data'):
+            st.audio(st.session_state.audio_data, format=audio_mime_type(st.session_state.audio_data))
+
     with st.form("feedback_form", clear_on_submit=True):
         # Basic Information Section
         st.markdown('<div class="form-section">', unsafe_allow_html=True)
@@ -802,18 +823,6 @@ def feedback_form():
             height=120
         )
         
-        st.markdown("#### 🎤 Voice Recording (Optional)")
-        st.markdown("Record a voice message to share your thoughts:")
-        
-        # Audio recorder
-        audio_recorder()
-        
-        # Show recording status
-        if st.session_state.get('recording_saved', False):
-            st.success("✅ Voice recording ready for submission!")
-            if st.session_state.get('audio_data'):
-                st.audio(open(st.session_state.audio_data, 'rb').read(), format='audio/wav')
-        
         st.markdown('</div>', unsafe_allow_html=True)
 
         # Submit button
@@ -963,8 +972,7 @@ def admin_dashboard():
             with col1:
                 if st.button("🗑️ Delete All Submissions"):
                     if show_confirmation_dialog("Delete All", len(df)):
-                        for i in range(len(df)):
-                            delete_submission(0, permanent=False)
+                        delete_submissions(df.index.tolist())
                         st.success("All submissions moved to deleted entries")
                         st.rerun()
             
@@ -1018,7 +1026,7 @@ def admin_dashboard():
                     # Audio playback
                     if row['audio_file'] and pd.notna(row['audio_file']):
                         st.write("**Voice Recording:**")
-                        play_audio(row['audio_file'])
+                        lazy_play_audio(row['audio_file'])
                     
                     # Action buttons
                     col1, col2, col3 = st.columns(3)
@@ -1037,6 +1045,8 @@ def admin_dashboard():
 
     with tab2:
         st.markdown("### 🗑️ Deleted Entries")
+        show_archive_browser()
+        show_point_in_time_restore()
         
         if deleted_df.empty:
             st.info("No deleted entries found.")
@@ -1046,8 +1056,7 @@ def admin_dashboard():
             # Bulk restore
             if st.button("↩️ Restore All Deleted Entries"):
                 if show_confirmation_dialog("Restore All", len(deleted_df)):
-                    for i in range(len(deleted_df)):
-                        restore_deleted_entry(0)
+                    restore_entries(deleted_df.index.tolist())
                     st.success("All entries restored")
                     st.rerun()
             
@@ -1074,7 +1083,7 @@ def admin_dashboard():
                     # Audio playback for deleted entries
                     if row['audio_file'] and pd.notna(row['audio_file']):
                         st.write("**Voice Recording:**")
-                        play_audio(row['audio_file'])
+                        lazy_play_audio(row['audio_file'])
                     
                     # Restore button
                     if st.button(f"↩️ Restore", key=f"restore_{i}"):
@@ -1085,13 +1094,17 @@ def admin_dashboard():
     with tab3:
         st.markdown("### 📈 Analytics Dashboard")
         
-        if df.empty:
-            st.info("No data available for analytics.")
+        start_date, end_date = analytics_date_range("analytics_dates")
+        rating_cols = ['engagement', 'safety', 'cleanliness', 'fun', 'learning', 'planning', 'safety_space']
+        analytics_df = load_analytics_data(['timestamp', 'programme_mask'] + rating_cols, start_date, end_date)
+        
+        if analytics_df.empty:
+            st.info("No data available for analytics in the selected period.")
         else:
+            
             # Rating distribution
             st.markdown("#### Rating Distribution")
-            rating_cols = ['engagement', 'safety', 'cleanliness', 'fun', 'learning', 'planning', 'safety_space']
-            rating_data = df[rating_cols].melt(var_name='Category', value_name='Rating')
+            rating_data = analytics_df[rating_cols].melt(var_name='Category', value_name='Rating')
             
             chart = alt.Chart(rating_data).mark_bar().encode(
                 x=alt.X('Category:N', title='Rating Category'),
@@ -1103,7 +1116,8 @@ def admin_dashboard():
             
             # Programme popularity
             st.markdown("#### Programme Popularity")
-            programme_counts = df['programme'].value_counts()
+            # Per-programme sums over the bitmask, so multi-programme visits count for each
+            programme_counts = open_store(DATABASE_FILE).programme_counts(analytics_df['programme_mask'])
             
             chart2 = alt.Chart(programme_counts.reset_index()).mark_arc().encode(
                 theta=alt.Theta('count:Q'),
@@ -1115,8 +1129,8 @@ def admin_dashboard():
             
             # Submissions over time
             st.markdown("#### Submissions Over Time")
-            df['date'] = pd.to_datetime(df['timestamp']).dt.date
-            daily_counts = df.groupby('date').size().reset_index(name='count')
+            analytics_df['date'] = analytics_df['timestamp'].dt.date
+            daily_counts = analytics_df.groupby('date').size().reset_index(name='count')
             
             chart3 = alt.Chart(daily_counts).mark_line(point=True).encode(
                 x=alt.X('date:T', title='Date'),
@@ -1137,14 +1151,10 @@ def admin_dashboard():
             if st.button("🗑️ Clear All Data"):
                 if show_confirmation_dialog("Clear All Data", len(df) + len(deleted_df)):
                     try:
-                        # Clear submissions
-                        pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(SUBMISSIONS_FILE, index=False)
-                        # Clear deleted entries
-                        pd.DataFrame(columns=EXPECTED_COLUMNS).to_csv(DELETED_ENTRIES_FILE, index=False)
-                        # Clear audio files
-                        for file in os.listdir(AUDIO_DIR):
-                            if file.endswith('.wav'):
-                                os.remove(os.path.join(AUDIO_DIR, file))
+                        # Clear submissions and deleted entries
+                        open_store(DATABASE_FILE).clear()
+                        # Clear recordings in every format, plus unfinished uploads
+                        clear_recordings(AUDIO_DIR)
                         st.success("All data cleared successfully")
                         st.rerun()
                     except Exception as e:
@@ -0,0 +1,1289 @@
+"""Shared storage helpers for the Play Africa feedback apps"""
+import glob
+import json
+import os
+import queue
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from safe_io import atomic_write, file_lock, write_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    # Without pyarrow, analytics frames are typed straight from the database
+    pa = pacsv = pq = None
+
+SUBMISSIONS_TABLE = "submissions"
+
+class Column(NamedTuple):
+    """One submission field
+
+    ``dtype`` is the pandas dtype the field is cast to for analysis, and
+    also decides the SQLite affinity (integers for ``Int*``, text
+    otherwise). ``default`` fills the field when a row lacks it, and
+    ``nullable=False`` fields must be present on every new submission.
+    """
+    name: str
+    dtype: str
+    nullable: bool = True
+    default: object = None
+
+    @property
+    def sql_type(self) -> str:
+        return "INTEGER" if self.dtype.startswith("Int") else "TEXT"
+
+
+# Values that do not fit a column's type (e.g. free-text children counts
+# from older forms) are stored unchanged and only coerced when typed.
+SUBMISSION_SCHEMA = [
+    Column('timestamp', 'datetime64[ns]', nullable=False),
+    Column('school', 'string', nullable=False),
+    Column('group_type', 'category'),
+    Column('children_no', 'Int32'),
+    Column('children_age', 'string'),
+    Column('adults_present', 'Int32'),
+    Column('visit_date', 'datetime64[ns]'),
+    Column('programme', 'category'),
+    Column('programme_mask', 'Int64'),
+    Column('engagement', 'Int8'),
+    Column('safety', 'Int8'),
+    Column('cleanliness', 'Int8'),
+    Column('fun', 'Int8'),
+    Column('learning', 'Int8'),
+    Column('planning', 'Int8'),
+    Column('safety_space', 'Int8'),
+    Column('comments', 'string'),
+    Column('enjoyed', 'string'),
+    Column('curiosity', 'string'),
+    Column('support_goals', 'string'),
+    Column('improve', 'string'),
+    Column('recommend', 'string'),
+    Column('future_topics', 'string'),
+    Column('collaboration', 'category'),
+    Column('audio_file', 'string'),
+    Column('audio_duration_ms', 'Int32'),
+    Column('device_type', 'category', default='Unknown'),
+]
+SCHEMA_BY_NAME = {col.name: col for col in SUBMISSION_SCHEMA}
+COLUMN_TYPES = {col.name: col.sql_type for col in SUBMISSION_SCHEMA}
+SUBMISSION_COLUMNS = list(COLUMN_TYPES)
+
+# Programmes are numbered in the ``programmes`` table as they first appear
+# and each submission's set is stored as a bitmask in ``programme_mask``;
+# SQLite integers are signed 64-bit, so 63 programmes fit
+PROGRAMMES_TABLE = "programmes"
+MAX_PROGRAMMES = 63
+
+# Submissions are partitioned by the month of their timestamp ("2025-07");
+# rows whose timestamp does not start with a date share one partition.
+# ``partitions`` holds a version per month that every write touching the
+# month bumps, so snapshots can rebuild just the months that changed.
+PARTITIONS_TABLE = "partitions"
+UNDATED_PARTITION = "undated"
+PARTITION_SQL = (
+    "CASE WHEN timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*' "
+    f"THEN substr(timestamp, 1, 7) ELSE '{UNDATED_PARTITION}' END"
+)
+
+# Every change to ``submissions`` is also appended to ``events``, in the
+# same transaction, so the table can be rebuilt as of any moment from a
+# backup plus the events after it. Ops: insert (data holds the stored row),
+# delete and restore (data holds deleted_at), update (data holds the changed
+# fields), purge and archive (the row left the table) and clear (data holds
+# which rows it removed).
+EVENTS_TABLE = "events"
+
+# Recordings the transcoder gave up on (file gone or ffmpeg failed), keyed
+# by row and path so replacing the recording makes it eligible again. Kept
+# out of the change log and backups: it is bookkeeping, not submission data.
+AUDIO_SKIPPED_TABLE = "audio_skipped"
+
+# Answers fresh.py used to pack into ``comments`` as one JSON object
+COMMENT_FIELDS = ['enjoyed', 'curiosity', 'support_goals', 'improve', 'recommend', 'future_topics', 'collaboration']
+
+# Storage-only columns that are not part of a submission
+ID_COLUMN = 'id'
+DELETED_AT_COLUMN = 'deleted_at'
+
+# Everything stored for a row, in export order
+STORED_COLUMNS = [ID_COLUMN] + SUBMISSION_COLUMNS + [DELETED_AT_COLUMN]
+
+INDEXED_COLUMNS = ['timestamp', 'visit_date', 'school', 'group_type', DELETED_AT_COLUMN]
+
+# Bumped whenever the on-disk layout changes; stored in PRAGMA user_version
+SCHEMA_VERSION = 8
+
+# Group commit: how long the writer waits for more submissions to join a
+# batch, and the most it commits in one transaction
+GROUP_COMMIT_WINDOW = 0.005
+GROUP_COMMIT_MAX_BATCH = 500
+
+# How often (seconds) each process checks for rows due for the cold archive
+RETENTION_CHECK_INTERVAL = 3600
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+SQL_BATCH_SIZE = 500
+
+ACTIVE_ONLY = "deleted_at IS NULL"
+DELETED_ONLY = "deleted_at IS NOT NULL"
+
+
+def _sql_value(value):
+    """Convert pandas/numpy values into something sqlite3 can bind"""
+    if value is None:
+        return None
+    if isinstance(value, float) and pd.isna(value):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, str):
+        return value if value != "" else None
+    if isinstance(value, (int, float)):
+        return value
+    return str(value)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def new_submission_id(created: Optional[datetime] = None) -> str:
+    """Return a unique ID that sorts by creation time
+
+    48 bits of milliseconds since the epoch followed by 64 random bits,
+    hex encoded, so IDs can be generated by any process without
+    coordination and still order like the submissions they name.
+    """
+    created = created or datetime.now()
+    return f"{int(created.timestamp() * 1000):012x}{secrets.token_hex(8)}"
+
+
+def _id_for_timestamp(timestamp) -> str:
+    """Build an ID for a legacy row from its own timestamp where possible"""
+    parsed = pd.to_datetime(timestamp, errors="coerce") if timestamp else pd.NaT
+    return new_submission_id(None if pd.isna(parsed) else parsed.to_pydatetime())
+
+
+def analytics_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast loaded submissions to their schema dtypes for analysis
+
+    Integer fields that are not plain numbers fall back to their leading
+    number ("25 kids" -> 25), so dashboards no longer re-infer or patch
+    types on every render.
+    """
+    df = df.copy()
+    for col in SUBMISSION_SCHEMA:
+        if col.name not in df.columns:
+            continue
+        values = df[col.name]
+        if col.dtype.startswith("Int"):
+            numbers = pd.to_numeric(values, errors="coerce")
+            leading = values.astype("string").str.extract(r"(\d+)", expand=False)
+            df[col.name] = numbers.fillna(pd.to_numeric(leading, errors="coerce")).round().astype(col.dtype)
+        elif col.dtype.startswith("datetime"):
+            df[col.name] = pd.to_datetime(values, errors="coerce", format="ISO8601")
+        else:
+            df[col.name] = values.astype(col.dtype)
+    return df.reset_index(drop=True)
+
+
+def with_defaults(entry: Dict) -> Dict:
+    """Fill fields a row lacks from the schema defaults"""
+    entry = dict(entry)
+    for col in SUBMISSION_SCHEMA:
+        if _sql_value(entry.get(col.name)) is None:
+            entry[col.name] = col.default
+    return entry
+
+
+def split_comment_fields(entry: Dict) -> Dict:
+    """Move answers packed into ``comments`` as JSON into their own fields"""
+    comments = entry.get('comments')
+    if not isinstance(comments, str) or not comments.lstrip().startswith("{"):
+        return entry
+    try:
+        answers = json.loads(comments)
+    except json.JSONDecodeError:
+        return entry
+    if not isinstance(answers, dict) or not set(answers) <= set(COMMENT_FIELDS):
+        # Not one of ours; leave free-text comments alone
+        return entry
+    entry = dict(entry)
+    for field, value in answers.items():
+        if _sql_value(entry.get(field)) is None:
+            entry[field] = value
+    entry['comments'] = None
+    return entry
+
+
+def programme_names(value) -> List[str]:
+    """Programmes named by a stored ``programme`` value: one name or a JSON list"""
+    if not isinstance(value, str) or not value.strip():
+        return []
+    if value.lstrip().startswith("["):
+        try:
+            names = json.loads(value)
+        except json.JSONDecodeError:
+            names = None
+        if isinstance(names, list):
+            return [str(name) for name in names if str(name).strip()]
+    return [value]
+
+
+def _programme_mask(conn: sqlite3.Connection, value) -> Optional[int]:
+    """Bitmask for a ``programme`` value, numbering unseen programmes"""
+    names = programme_names(value)
+    if not names:
+        return None
+    mask = 0
+    for name in names:
+        row = conn.execute(f"SELECT bit FROM {PROGRAMMES_TABLE} WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            bit = conn.execute(f"SELECT COALESCE(MAX(bit), -1) + 1 FROM {PROGRAMMES_TABLE}").fetchone()[0]
+            if bit >= MAX_PROGRAMMES:
+                raise ValueError(f"Cannot register programme '{name}': all {MAX_PROGRAMMES} programme slots are used")
+            conn.execute(f"INSERT INTO {PROGRAMMES_TABLE} (name, bit) VALUES (?, ?)", (name, bit))
+        else:
+            bit = row[0]
+        mask |= 1 << bit
+    return mask
+
+
+def programme_counts(masks: pd.Series, bits: Dict[str, int]) -> pd.Series:
+    """Submissions per programme, counting multi-programme visits once for each"""
+    masks = pd.to_numeric(masks, errors="coerce").fillna(0).astype("int64").to_numpy()
+    counts = pd.Series(
+        {name: int(((masks & (1 << bit)) != 0).sum()) for name, bit in bits.items()}, dtype="int64", name="count"
+    )
+    counts.index.name = "programme"
+    return counts[counts > 0].sort_values(ascending=False)
+
+
+def partition_month(timestamp) -> str:
+    """Partition a row belongs to, matching ``PARTITION_SQL``"""
+    # Compare the value as it is stored, not as it was passed in
+    timestamp = _sql_value(timestamp)
+    match = re.match(r"\d{4}-\d{2}", str(timestamp)) if timestamp is not None else None
+    return match.group(0) if match else UNDATED_PARTITION
+
+
+def _month_in_range(month: str, start_date=None, end_date=None) -> bool:
+    if month == UNDATED_PARTITION:
+        return not (start_date or end_date)
+    return ((not start_date or month >= str(start_date)[:7])
+            and (not end_date or month <= str(end_date)[:7]))
+
+
+def _touch_partitions(conn: sqlite3.Connection, timestamps) -> None:
+    """Bump the version of every partition holding one of ``timestamps``"""
+    conn.executemany(
+        f"INSERT INTO {PARTITIONS_TABLE} (month, version) VALUES (?, 1) "
+        "ON CONFLICT(month) DO UPDATE SET version = version + 1",
+        [(month,) for month in sorted({partition_month(timestamp) for timestamp in timestamps})]
+    )
+
+
+def _log_events(conn: sqlite3.Connection, op: str, events: List[Tuple[Optional[str], Optional[Dict]]]) -> None:
+    """Append ``(submission_id, data)`` events for ``op`` to the change log"""
+    at = _now()
+    conn.executemany(
+        f"INSERT INTO {EVENTS_TABLE} (at, op, submission_id, data) VALUES (?, ?, ?, ?)",
+        [(at, op, submission_id, json.dumps(data) if data is not None else None) for submission_id, data in events]
+    )
+
+
+def _check_required(entry: Dict) -> None:
+    for col in SUBMISSION_SCHEMA:
+        if not col.nullable and _sql_value(entry.get(col.name)) is None:
+            raise ValueError(f"Submission is missing required field '{col.name}'")
+
+
+def read_submissions_csv(path: str, typed: bool = False) -> pd.DataFrame:
+    """Read a submissions CSV (legacy file or backup) using the schema
+
+    Only known columns are read, all as text with no type inference, so
+    free-text values survive; the pyarrow engine parses large files on
+    several threads. ``typed=True`` also parses dates and casts to the
+    schema dtypes. Columns the file lacks are added once here, filled
+    with their defaults.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=SUBMISSION_COLUMNS)
+    header = pd.read_csv(path, nrows=0).columns
+    present = [col.name for col in SUBMISSION_SCHEMA if col.name in header]
+    extra = [name for name in (ID_COLUMN, DELETED_AT_COLUMN) if name in header]
+    if pacsv is not None:
+        # Column types are given to pyarrow itself; pandas' pyarrow engine
+        # infers first and would rewrite values that look like dates
+        table = pacsv.read_csv(
+            path,
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=present + extra,
+                column_types={name: pa.string() for name in present + extra},
+                strings_can_be_null=False,
+            ),
+        )
+        df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+    else:
+        df = pd.read_csv(
+            path,
+            usecols=present + extra,
+            dtype={name: "string" for name in present + extra},
+            keep_default_na=False,
+        )
+    for col in SUBMISSION_SCHEMA:
+        if col.name not in df.columns:
+            df[col.name] = col.default
+    df = df[extra[:1] + SUBMISSION_COLUMNS + extra[1:]]
+    return analytics_frame(df) if typed else df
+
+
+# Submission columns as of schema v1; migrations run against the layout
+# they upgrade from, never the current SUBMISSION_SCHEMA
+_V1_COLUMNS = [
+    'timestamp', 'school', 'group_type', 'children_no', 'children_age', 'adults_present',
+    'visit_date', 'programme', 'engagement', 'safety', 'cleanliness', 'fun', 'learning',
+    'planning', 'safety_space', 'comments', 'audio_file', 'device_type',
+]
+
+# Defaults the v4 migration backfilled, and the columns v5 split out of comments
+_V4_COLUMN_DEFAULTS = {'device_type': 'Unknown'}
+_V5_COMMENT_FIELDS = ['enjoyed', 'curiosity', 'support_goals', 'improve', 'recommend', 'future_topics', 'collaboration']
+
+
+def _merge_deleted_entries(conn: sqlite3.Connection) -> None:
+    """v2: fold the separate deleted_entries table into tombstones on submissions"""
+    columns = ", ".join(_V1_COLUMNS)
+    conn.execute(f"ALTER TABLE {SUBMISSIONS_TABLE} ADD COLUMN {DELETED_AT_COLUMN} TEXT")
+    conn.execute(
+        f"INSERT INTO {SUBMISSIONS_TABLE} ({columns}, {DELETED_AT_COLUMN}) "
+        f"SELECT {columns}, ? FROM deleted_entries ORDER BY rowid",
+        (_now(),)
+    )
+    conn.execute("DROP TABLE deleted_entries")
+
+
+def _add_submission_ids(conn: sqlite3.Connection) -> None:
+    """v3: give every existing row a stable ID derived from its timestamp"""
+    conn.execute(f"ALTER TABLE {SUBMISSIONS_TABLE} ADD COLUMN {ID_COLUMN} TEXT")
+    rows = conn.execute(f"SELECT rowid, timestamp FROM {SUBMISSIONS_TABLE}").fetchall()
+    conn.executemany(
+        f"UPDATE {SUBMISSIONS_TABLE} SET {ID_COLUMN} = ? WHERE rowid = ?",
+        [(_id_for_timestamp(timestamp), rowid) for rowid, timestamp in rows]
+    )
+
+
+def _apply_column_defaults(conn: sqlite3.Connection) -> None:
+    """v4: fill fields older rows never had with their schema defaults"""
+    for name, default in _V4_COLUMN_DEFAULTS.items():
+        conn.execute(f"UPDATE {SUBMISSIONS_TABLE} SET {name} = ? WHERE {name} IS NULL", (default,))
+
+
+def _split_comments_column(conn: sqlite3.Connection) -> None:
+    """v5: give the answers packed into ``comments`` JSON their own columns"""
+    for field in _V5_COMMENT_FIELDS:
+        conn.execute(f"ALTER TABLE {SUBMISSIONS_TABLE} ADD COLUMN {field} TEXT")
+    updates = []
+    for rowid, comments in conn.execute(
+        f"SELECT rowid, comments FROM {SUBMISSIONS_TABLE} WHERE comments LIKE '{{%'"
+    ).fetchall():
+        entry = split_comment_fields({'comments': comments})
+        if entry['comments'] is None:
+            updates.append(tuple(_sql_value(entry.get(field)) for field in _V5_COMMENT_FIELDS) + (rowid,))
+    assignments = ", ".join(f"{field} = ?" for field in _V5_COMMENT_FIELDS)
+    conn.executemany(
+        f"UPDATE {SUBMISSIONS_TABLE} SET comments = NULL, {assignments} WHERE rowid = ?", updates
+    )
+
+
+def _add_programme_masks(conn: sqlite3.Connection) -> None:
+    """v6: encode each row's programmes as a bitmask over the programme registry"""
+    conn.execute(f"ALTER TABLE {SUBMISSIONS_TABLE} ADD COLUMN programme_mask INTEGER")
+    rows = conn.execute(
+        f"SELECT rowid, programme FROM {SUBMISSIONS_TABLE} WHERE programme IS NOT NULL ORDER BY rowid"
+    ).fetchall()
+    conn.executemany(
+        f"UPDATE {SUBMISSIONS_TABLE} SET programme_mask = ? WHERE rowid = ?",
+        [(_programme_mask(conn, programme), rowid) for rowid, programme in rows]
+    )
+
+
+def _add_partitions(conn: sqlite3.Connection) -> None:
+    """v7: register the month partitions existing rows fall into"""
+    conn.execute(
+        f"INSERT OR IGNORE INTO {PARTITIONS_TABLE} (month, version) "
+        f"SELECT DISTINCT {PARTITION_SQL}, 1 FROM {SUBMISSIONS_TABLE}"
+    )
+
+
+def _add_audio_durations(conn: sqlite3.Connection) -> None:
+    """v8: add the recording length column filled in by the transcoder"""
+    conn.execute(f"ALTER TABLE {SUBMISSIONS_TABLE} ADD COLUMN audio_duration_ms INTEGER")
+
+
+# Schema upgrades keyed by the version they produce
+_MIGRATIONS: Dict[int, Callable[[sqlite3.Connection], None]] = {
+    2: _merge_deleted_entries,
+    3: _add_submission_ids,
+    4: _apply_column_defaults,
+    5: _split_comments_column,
+    6: _add_programme_masks,
+    7: _add_partitions,
+    8: _add_audio_durations,
+}
+
+
+class _CachedFrame(NamedTuple):
+    version: int
+    generation: int
+    last_rowid: int
+    df: pd.DataFrame
+
+
+class _GroupCommitWriter:
+    """Single writer thread that commits queued inserts in batches
+
+    Everything that arrives within ``GROUP_COMMIT_WINDOW`` of the first
+    queued entry is written in one transaction, so a burst of submissions
+    costs one commit and one fsync instead of one each.
+    """
+
+    def __init__(self, store: "SubmissionStore"):
+        self._store = store
+        self._queue: "queue.Queue[Tuple[dict, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, entry: dict) -> Future:
+        """Queue an entry; the future resolves to its ID once it is durable"""
+        future: Future = Future()
+        self._queue.put((entry, future))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[dict, Future]]) -> None:
+        try:
+            ids = self._store.insert_many([entry for entry, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Retry one by one so a single bad entry cannot fail the others
+            for entry, future in batch:
+                self._commit([(entry, future)])
+            return
+        for (_, future), submission_id in zip(batch, ids):
+            future.set_result(submission_id)
+
+
+class SubmissionStore:
+    """SQLite backed store for feedback submissions
+
+    Every submission gets a stable ``id`` when it is written and all
+    updates address rows by that ID, so they stay correct while other
+    admins delete rows concurrently. Deleted entries live in the same
+    table with ``deleted_at`` set, so deleting and restoring are
+    single-row updates and the "active" and "deleted" views are filters
+    over one table. The database runs in WAL mode so dashboard sessions
+    can keep reading while a visitor's submission is being written. Each
+    thread (Streamlit runs one per session) gets its own connection.
+
+    Every write transaction that changes rows bumps a ``data_version``
+    counter in the database, and unfiltered loads are cached against it.
+    Sessions (and the several loads within one rerun) share the parsed
+    frames until a write from any process changes the version. Writes other than plain
+    inserts also bump ``generation``; while it is unchanged the table has
+    only grown, so a stale cached frame is topped up with the rows past
+    its last rowid instead of being reloaded.
+
+    Old submissions and long-deleted entries are moved out of the database
+    into monthly gzip CSV archives (``apply_retention``), which are only
+    read when asked for (``load_archived``).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.snapshot_dir = os.path.join(os.path.dirname(db_path), "snapshots", "submissions")
+        self.manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+        self.archive_dir = os.path.join(os.path.dirname(db_path), "archive")
+        self._retention_checked_at: Optional[float] = None
+        self._retention_lock = threading.Lock()
+        self._local = threading.local()
+        self._cache: Dict[bool, _CachedFrame] = {}
+        self._cache_lock = threading.Lock()
+        self._writer = _GroupCommitWriter(self)
+        self._create_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, append_only: bool = False) -> Iterator[sqlite3.Connection]:
+        """Run a write transaction that takes the write lock up front
+
+        ``append_only`` transactions promise to only insert new rows, which
+        lets cached frames catch up by reading just the new tail. A
+        transaction that changes no rows leaves the versions and the cache
+        alone, so no-op writes do not invalidate every session's frames.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        changes_before = conn.total_changes
+        try:
+            yield conn
+            changed = conn.total_changes != changes_before
+            if changed:
+                for key in ("data_version",) if append_only else ("data_version", "generation"):
+                    conn.execute(
+                        "INSERT INTO store_meta (key, value) VALUES (?, 1) "
+                        "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+                        (key,)
+                    )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if changed and not append_only:
+            with self._cache_lock:
+                self._cache.clear()
+
+    def _create_schema(self) -> None:
+        """Create the latest layout, or upgrade an existing database to it"""
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {PROGRAMMES_TABLE} (name TEXT PRIMARY KEY, bit INTEGER UNIQUE NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (month TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "at TEXT NOT NULL, op TEXT NOT NULL, submission_id TEXT, data TEXT)"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {AUDIO_SKIPPED_TABLE} ({ID_COLUMN} TEXT PRIMARY KEY, "
+                "audio_file TEXT NOT NULL, at TEXT NOT NULL, reason TEXT)"
+            )
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SUBMISSIONS_TABLE,)
+            ).fetchone()
+
+            if not exists:
+                column_defs = ", ".join(f"{col} {sql_type}" for col, sql_type in COLUMN_TYPES.items())
+                conn.execute(
+                    f"CREATE TABLE {SUBMISSIONS_TABLE} "
+                    f"({ID_COLUMN} TEXT, {column_defs}, {DELETED_AT_COLUMN} TEXT)"
+                )
+            else:
+                # Databases from before versioning have the v1 layout; version 1
+                # itself was only ever written by a completed CSV import
+                if version == 1:
+                    self._set_meta(conn, "legacy_csv_imported", "1")
+                for target in range(max(version, 1) + 1, SCHEMA_VERSION + 1):
+                    _MIGRATIONS[target](conn)
+
+            conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{SUBMISSIONS_TABLE}_{ID_COLUMN} "
+                f"ON {SUBMISSIONS_TABLE} ({ID_COLUMN})"
+            )
+            for col in INDEXED_COLUMNS:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{SUBMISSIONS_TABLE}_{col} ON {SUBMISSIONS_TABLE} ({col})"
+                )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{SUBMISSIONS_TABLE}_partition "
+                f"ON {SUBMISSIONS_TABLE} ({PARTITION_SQL}, {DELETED_AT_COLUMN})"
+            )
+            # Only rows still waiting for the transcoder, which polls for them
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{SUBMISSIONS_TABLE}_untranscoded ON {SUBMISSIONS_TABLE} ({ID_COLUMN}) "
+                "WHERE audio_file IS NOT NULL AND audio_duration_ms IS NULL"
+            )
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        os.chmod(self.db_path, 0o666)
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
+        conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def data_version(self) -> int:
+        """Counter bumped by every committed write, from any process"""
+        return int(self._get_meta(self._connect(), "data_version") or 0)
+
+    def _versions(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        return (int(self._get_meta(conn, "data_version") or 0),
+                int(self._get_meta(conn, "generation") or 0))
+
+    # Reads
+
+    def load(self, deleted: bool = False, school: Optional[str] = None,
+             programme: Optional[str] = None, start_date: Optional[str] = None,
+             end_date: Optional[str] = None) -> pd.DataFrame:
+        """Load active (or deleted) rows in insertion order, optionally filtered on indexed columns
+
+        The frame is indexed by submission ID, which gives callers an
+        in-memory ID -> row lookup (``df.loc[submission_id]``) for details
+        and actions; the ID is also kept as a regular column for exports.
+        Unfiltered loads are served from the cache while the data version
+        is unchanged, and only read rows added since otherwise.
+        """
+        filtered = any((school, programme, start_date, end_date))
+        clauses, params = [DELETED_ONLY if deleted else ACTIVE_ONLY], []
+        if school:
+            clauses.append("school LIKE ?")
+            params.append(f"%{school}%")
+        if programme:
+            # Any visit that included the programme, alone or with others
+            bit = self.programme_bits().get(programme)
+            clauses.append("(programme_mask >> ?) & 1 = 1" if bit is not None else "0")
+            params.extend([bit] if bit is not None else [])
+        if start_date:
+            clauses.append("visit_date >= ?")
+            params.append(str(start_date))
+        if end_date:
+            clauses.append("visit_date <= ?")
+            params.append(str(end_date))
+
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            # Versions, high-water mark and rows all come from one snapshot
+            version, generation = self._versions(conn)
+            cached = None
+            if not filtered:
+                with self._cache_lock:
+                    cached = self._cache.get(deleted)
+                if cached and cached.version == version:
+                    # Callers reshape the frame they get, so hand out a copy
+                    return cached.df.copy()
+                if cached and cached.generation != generation:
+                    cached = None
+            if cached is not None:
+                clauses.append("rowid > ?")
+                params.append(cached.last_rowid)
+
+            last_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {SUBMISSIONS_TABLE}").fetchone()[0]
+            query = (
+                f"SELECT {', '.join([ID_COLUMN] + SUBMISSION_COLUMNS)} FROM {SUBMISSIONS_TABLE} "
+                f"WHERE {' AND '.join(clauses)} ORDER BY rowid"
+            )
+            df = pd.read_sql_query(query, conn, params=params)
+        finally:
+            conn.execute("COMMIT")
+        df.index = pd.Index(df[ID_COLUMN].tolist())
+
+        if cached is not None and not df.empty:
+            df = pd.concat([cached.df, df]) if not cached.df.empty else df
+        elif cached is not None:
+            df = cached.df
+        if not filtered:
+            with self._cache_lock:
+                self._cache[deleted] = _CachedFrame(version, generation, last_rowid, df)
+            return df.copy()
+        return df
+
+    def load_analytics(self, columns: Optional[List[str]] = None, start_date=None,
+                       end_date=None) -> pd.DataFrame:
+        """Load active rows with analytics dtypes, reading only ``columns``
+
+        Served from one Parquet snapshot per month partition, listed in a
+        manifest with the partition version each was built from. Only the
+        months overlapping ``start_date``..``end_date`` (submission dates,
+        inclusive) are read, and only those whose version moved on are
+        rebuilt, so old months are not touched once written. Reads are
+        memory mapped and project just the requested columns.
+        """
+        read_columns = columns
+        if columns and (start_date or end_date) and 'timestamp' not in columns:
+            read_columns = list(columns) + ['timestamp']
+
+        if pq is None:
+            df = analytics_frame(self.load())
+        else:
+            months = [month for month in self.partition_versions() if _month_in_range(month, start_date, end_date)]
+            frames = [
+                pq.read_table(path, columns=read_columns, memory_map=True).to_pandas()
+                for path in self._refresh_partitions(months)
+            ]
+            if frames:
+                df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+                for name in df.columns:
+                    # Each partition has its own categories; unify them
+                    if name in SCHEMA_BY_NAME and SCHEMA_BY_NAME[name].dtype == "category":
+                        df[name] = df[name].astype("category")
+            else:
+                df = analytics_frame(pd.DataFrame(columns=[ID_COLUMN] + SUBMISSION_COLUMNS))
+
+        if start_date or end_date:
+            keep = pd.Series(True, index=df.index)
+            if start_date:
+                keep &= df['timestamp'] >= pd.Timestamp(start_date)
+            if end_date:
+                keep &= df['timestamp'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            df = df[keep].reset_index(drop=True)
+        return df[columns] if columns else df
+
+    def partition_versions(self) -> Dict[str, int]:
+        """Known month partitions and their current versions, oldest first"""
+        return dict(self._connect().execute(
+            f"SELECT month, version FROM {PARTITIONS_TABLE} ORDER BY month"
+        ).fetchall())
+
+    def _refresh_partitions(self, months: List[str]) -> List[str]:
+        """Rebuild stale snapshots for ``months``, returning the non-empty ones' paths"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with file_lock(self.manifest_path):
+            manifest = _read_manifest(self.manifest_path)
+            partitions = manifest["partitions"]
+            # Versions are read before the rows, so a label can only lag
+            # its rows; a lagging label just triggers another rebuild
+            versions = self.partition_versions()
+            changed = False
+            for month in months:
+                entry = partitions.get(month)
+                if entry is not None and entry["version"] == versions.get(month):
+                    continue
+                partitions[month] = self._write_partition(month, versions.get(month, 0))
+                changed = True
+            if changed:
+                write_json(self.manifest_path, manifest, indent=2)
+        return [
+            os.path.join(self.snapshot_dir, partitions[month]["file"])
+            for month in months if partitions[month]["rows"]
+        ]
+
+    def _write_partition(self, month: str, version: int) -> Dict:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join([ID_COLUMN] + SUBMISSION_COLUMNS)} FROM {SUBMISSIONS_TABLE} "
+            f"WHERE {PARTITION_SQL} = ? AND {ACTIVE_ONLY} ORDER BY rowid",
+            self._connect(),
+            params=(month,)
+        )
+        file_name = f"{month}.parquet"
+        path = os.path.join(self.snapshot_dir, file_name)
+        if df.empty:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            table = pa.Table.from_pandas(analytics_frame(df), preserve_index=False)
+            with atomic_write(path, "wb") as f:
+                pq.write_table(table, f)
+        return {"version": version, "rows": len(df), "file": file_name}
+
+    def programme_bits(self) -> Dict[str, int]:
+        """Registered programme names and their bit in ``programme_mask``"""
+        return dict(self._connect().execute(f"SELECT name, bit FROM {PROGRAMMES_TABLE} ORDER BY bit").fetchall())
+
+    def programme_counts(self, masks: pd.Series) -> pd.Series:
+        """Per-programme submission counts for a column of programme masks"""
+        return programme_counts(masks, self.programme_bits())
+
+    def get(self, submission_id: str) -> Optional[Dict]:
+        """Return a single row by ID, deleted or not"""
+        rows = self._rows(self._connect(), [submission_id])
+        return rows[0] if rows else None
+
+    def count(self, deleted: bool = False) -> int:
+        where = DELETED_ONLY if deleted else ACTIVE_ONLY
+        return self._connect().execute(
+            f"SELECT COUNT(*) FROM {SUBMISSIONS_TABLE} WHERE {where}"
+        ).fetchone()[0]
+
+    # Writes
+
+    def insert(self, entry: dict, timeout: Optional[float] = 30) -> str:
+        """Insert a single submission through the group-commit writer
+
+        Blocks until the batch containing the entry has been committed and
+        returns its ID. The entry is checked first, so an invalid one fails
+        here rather than inside someone else's batch.
+        """
+        entry = with_defaults(split_comment_fields(entry))
+        _check_required(entry)
+        return self._writer.submit(entry).result(timeout)
+
+    def insert_many(self, entries: List[dict]) -> List[str]:
+        """Insert several submissions in one transaction, returning their IDs"""
+        columns = [ID_COLUMN] + SUBMISSION_COLUMNS
+        placeholders = ", ".join("?" for _ in columns)
+        entries = [with_defaults(split_comment_fields(entry)) for entry in entries]
+        for entry in entries:
+            _check_required(entry)
+        ids = [entry.get(ID_COLUMN) or new_submission_id() for entry in entries]
+        with self._transaction(append_only=True) as conn:
+            for entry in entries:
+                entry['programme_mask'] = _programme_mask(conn, entry.get('programme'))
+            rows = [
+                (submission_id,) + tuple(_sql_value(entry.get(col)) for col in SUBMISSION_COLUMNS)
+                for submission_id, entry in zip(ids, entries)
+            ]
+            conn.executemany(
+                f"INSERT INTO {SUBMISSIONS_TABLE} ({', '.join(columns)}) VALUES ({placeholders})", rows
+            )
+            _touch_partitions(conn, [entry.get('timestamp') for entry in entries])
+            _log_events(conn, "insert", [(row[0], dict(zip(STORED_COLUMNS, row + (None,)))) for row in rows])
+        return ids
+
+    @staticmethod
+    def _rows(conn: sqlite3.Connection, submission_ids: List[str], where: str = "1") -> List[Dict]:
+        """Fetch rows by ID, in the order the IDs were given"""
+        columns = STORED_COLUMNS
+        found = {}
+        for start in range(0, len(submission_ids), SQL_BATCH_SIZE):
+            batch = submission_ids[start:start + SQL_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            for row in conn.execute(
+                f"SELECT {', '.join(columns)} FROM {SUBMISSIONS_TABLE} "
+                f"WHERE {ID_COLUMN} IN ({placeholders}) AND {where}",
+                batch
+            ):
+                found[row[0]] = dict(zip(columns, row))
+        return [found[submission_id] for submission_id in dict.fromkeys(submission_ids) if submission_id in found]
+
+    def _set_deleted(self, submission_ids: List[str], deleted: bool) -> List[Dict]:
+        with self._transaction() as conn:
+            # Only rows in the opposite state match, so rows another admin
+            # already deleted (or restored) are skipped
+            rows = self._rows(conn, submission_ids, ACTIVE_ONLY if deleted else DELETED_ONLY)
+            deleted_at = _now() if deleted else None
+            conn.executemany(
+                f"UPDATE {SUBMISSIONS_TABLE} SET {DELETED_AT_COLUMN} = ? WHERE {ID_COLUMN} = ?",
+                [(deleted_at, row[ID_COLUMN]) for row in rows]
+            )
+            _touch_partitions(conn, [row['timestamp'] for row in rows])
+            _log_events(conn, "delete" if deleted else "restore",
+                        [(row[ID_COLUMN], {DELETED_AT_COLUMN: deleted_at}) for row in rows])
+        return rows
+
+    def soft_delete(self, submission_id: str) -> Optional[Dict]:
+        """Mark an active submission as deleted, returning it"""
+        rows = self.soft_delete_many([submission_id])
+        return rows[0] if rows else None
+
+    def soft_delete_many(self, submission_ids: List[str]) -> List[Dict]:
+        """Mark several active submissions as deleted in one transaction, returning them"""
+        return self._set_deleted(list(submission_ids), True)
+
+    def restore(self, submission_id: str) -> Optional[Dict]:
+        """Clear the tombstone on a deleted submission, returning it"""
+        rows = self.restore_many([submission_id])
+        return rows[0] if rows else None
+
+    def restore_many(self, submission_ids: List[str]) -> List[Dict]:
+        """Clear the tombstones on several deleted submissions in one transaction, returning them"""
+        return self._set_deleted(list(submission_ids), False)
+
+    def purge(self, submission_id: str) -> Optional[Dict]:
+        """Permanently remove a submission, deleted or not, returning it"""
+        rows = self.purge_many([submission_id])
+        return rows[0] if rows else None
+
+    def purge_many(self, submission_ids: List[str]) -> List[Dict]:
+        """Permanently remove several submissions in one transaction, returning them"""
+        with self._transaction() as conn:
+            rows = self._rows(conn, list(submission_ids))
+            conn.executemany(
+                f"DELETE FROM {SUBMISSIONS_TABLE} WHERE {ID_COLUMN} = ?",
+                [(row[ID_COLUMN],) for row in rows]
+            )
+            _touch_partitions(conn, [row['timestamp'] for row in rows])
+            _log_events(conn, "purge", [(row[ID_COLUMN], None) for row in rows])
+        return rows
+
+    def clear(self, deleted: Optional[bool] = None) -> None:
+        """Permanently remove active rows, deleted rows, or (``None``) everything"""
+        where = "" if deleted is None else f"WHERE {DELETED_ONLY if deleted else ACTIVE_ONLY}"
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {SUBMISSIONS_TABLE} {where}")
+            conn.execute(f"UPDATE {PARTITIONS_TABLE} SET version = version + 1")
+            _log_events(conn, "clear", [(None, {"deleted": deleted})])
+
+    def recover(self, rows: List[Dict]) -> int:
+        """Bring back rows from a restore point that were lost or deleted since
+
+        Rows whose ID is gone from the table are re-inserted as they were,
+        and rows that were active then but are deleted now are restored.
+        Nothing present now is removed or overwritten. Returns the number
+        of rows changed.
+        """
+        with self._transaction() as conn:
+            current = {row[ID_COLUMN]: row for row in self._rows(conn, [row[ID_COLUMN] for row in rows])}
+            missing = [row for row in rows if row[ID_COLUMN] not in current]
+            undelete = [
+                row[ID_COLUMN] for row in rows
+                if row[ID_COLUMN] in current and current[row[ID_COLUMN]][DELETED_AT_COLUMN] is not None
+                and _sql_value(row.get(DELETED_AT_COLUMN)) is None
+            ]
+
+            for row in missing:
+                row['programme_mask'] = _programme_mask(conn, _sql_value(row.get('programme')))
+            values = [tuple(_sql_value(row.get(col)) for col in STORED_COLUMNS) for row in missing]
+            conn.executemany(
+                f"INSERT INTO {SUBMISSIONS_TABLE} ({', '.join(STORED_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in STORED_COLUMNS)})",
+                values
+            )
+            conn.executemany(
+                f"UPDATE {SUBMISSIONS_TABLE} SET {DELETED_AT_COLUMN} = NULL WHERE {ID_COLUMN} = ?",
+                [(submission_id,) for submission_id in undelete]
+            )
+            _touch_partitions(conn, [row.get('timestamp') for row in missing]
+                              + [current[submission_id]['timestamp'] for submission_id in undelete])
+            _log_events(conn, "insert", [(value[0], dict(zip(STORED_COLUMNS, value))) for value in values])
+            _log_events(conn, "restore", [(submission_id, {DELETED_AT_COLUMN: None}) for submission_id in undelete])
+        return len(missing) + len(undelete)
+
+    def untranscoded_audio(self, retry_skipped_before: Optional[str] = None) -> List[Tuple[str, str]]:
+        """``(id, audio_file)`` of every row whose recording has not been transcoded yet
+
+        Answered from a partial index in ID (so creation) order, so the
+        cost follows the number of pending rows rather than the table size.
+        Recordings passed to ``skip_audio`` are left out unless they were
+        skipped before the ISO timestamp ``retry_skipped_before``.
+        """
+        return self._connect().execute(
+            f"SELECT s.{ID_COLUMN}, s.audio_file FROM {SUBMISSIONS_TABLE} AS s "
+            f"LEFT JOIN {AUDIO_SKIPPED_TABLE} AS k ON k.{ID_COLUMN} = s.{ID_COLUMN} AND k.audio_file = s.audio_file "
+            "WHERE s.audio_file IS NOT NULL AND s.audio_duration_ms IS NULL AND s.audio_file != '' "
+            f"AND (k.at IS NULL OR k.at < ?) ORDER BY s.{ID_COLUMN}",
+            (retry_skipped_before or "",)
+        ).fetchall()
+
+    def skip_audio(self, submission_id: str, path: str, reason: str) -> None:
+        """Leave a row's recording out of ``untranscoded_audio`` from now on
+
+        Written outside ``_transaction``: no submission changes, so the data
+        version, caches and change log stay as they are.
+        """
+        self._connect().execute(
+            f"INSERT OR REPLACE INTO {AUDIO_SKIPPED_TABLE} ({ID_COLUMN}, audio_file, at, reason) VALUES (?, ?, ?, ?)",
+            (submission_id, path, _now(), reason)
+        )
+
+    def update_audio(self, submission_id: str, old_path: str, new_path: str, duration_ms: int) -> bool:
+        """Point a row at its transcoded recording, returning whether it was updated
+
+        The row only changes if it still refers to ``old_path``, so a
+        recording replaced or purged meanwhile is left alone.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT timestamp FROM {SUBMISSIONS_TABLE} WHERE {ID_COLUMN} = ? AND audio_file = ?",
+                (submission_id, old_path)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    f"UPDATE {SUBMISSIONS_TABLE} SET audio_file = ?, audio_duration_ms = ? WHERE {ID_COLUMN} = ?",
+                    (new_path, duration_ms, submission_id)
+                )
+                _touch_partitions(conn, [row[0]])
+                _log_events(conn, "update", [(submission_id, {'audio_file': new_path, 'audio_duration_ms': duration_ms})])
+        return row is not None
+
+    @contextmanager
+    def read_snapshot(self, batch_size: int = SQL_BATCH_SIZE) -> Iterator[Tuple[int, Iterator[Tuple]]]:
+        """Yield the change log position and every row as of one moment
+
+        Rows (tombstoned ones included) come in ID order as
+        ``STORED_COLUMNS`` tuples, fetched in batches from the same read
+        transaction as the position, so the whole table is never in memory
+        and exactly the events up to the position are reflected in them.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {EVENTS_TABLE}").fetchone()[0]
+            cursor = conn.execute(
+                f"SELECT {', '.join(STORED_COLUMNS)} FROM {SUBMISSIONS_TABLE} ORDER BY {ID_COLUMN}"
+            )
+
+            def rows() -> Iterator[Tuple]:
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield from batch
+
+            yield seq, rows()
+        finally:
+            conn.execute("COMMIT")
+
+    def iter_events(self, after_seq: int = 0, until: Optional[str] = None,
+                    batch_size: int = SQL_BATCH_SIZE) -> Iterator[Tuple[int, str, str, Optional[str], Optional[Dict]]]:
+        """Logged changes after ``after_seq`` (and at or before ``until``), oldest first
+
+        Yields ``(seq, at, op, submission_id, data)``, reading in batches
+        by sequence number so long histories are streamed.
+        """
+        conn = self._connect()
+        while True:
+            batch = conn.execute(
+                f"SELECT seq, at, op, submission_id, data FROM {EVENTS_TABLE} "
+                "WHERE seq > ? AND (? IS NULL OR at <= ?) ORDER BY seq LIMIT ?",
+                (after_seq, until, until, batch_size)
+            ).fetchall()
+            if not batch:
+                break
+            for seq, at, op, submission_id, data in batch:
+                yield seq, at, op, submission_id, json.loads(data) if data is not None else None
+            after_seq = batch[-1][0]
+
+    def prune_events(self, before_seq: int) -> int:
+        """Drop logged changes at or before ``before_seq``, returning how many went"""
+        # The log is not table data, so this does not bump the data version
+        return self._connect().execute(f"DELETE FROM {EVENTS_TABLE} WHERE seq <= ?", (before_seq,)).rowcount
+
+    # Retention
+
+    def apply_retention(self, max_age_days: Optional[int] = None,
+                        deleted_grace_days: Optional[int] = None) -> int:
+        """Move old submissions and long-deleted entries into the cold archive
+
+        Rows submitted more than ``max_age_days`` ago and entries deleted
+        more than ``deleted_grace_days`` ago are added to the archive for
+        their submission month and removed from the database; ``None``
+        disables either rule. Checks run at most every
+        ``RETENTION_CHECK_INTERVAL`` seconds per process. Returns the number
+        of rows archived.
+        """
+        now = time.monotonic()
+        with self._retention_lock:
+            if self._retention_checked_at is not None and now - self._retention_checked_at < RETENTION_CHECK_INTERVAL:
+                return 0
+            self._retention_checked_at = now
+
+        clauses, params = [], []
+        if max_age_days is not None:
+            clauses.append(f"({PARTITION_SQL} != '{UNDATED_PARTITION}' AND timestamp < ?)")
+            params.append((datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d"))
+        if deleted_grace_days is not None:
+            clauses.append(f"{DELETED_AT_COLUMN} < ?")
+            params.append((datetime.now() - timedelta(days=deleted_grace_days)).isoformat(timespec="seconds"))
+        if not clauses:
+            return 0
+        where = " OR ".join(clauses)
+        # Both conditions are on indexed columns, so the common case of
+        # nothing being due is a cheap read without the write lock
+        if self._connect().execute(f"SELECT 1 FROM {SUBMISSIONS_TABLE} WHERE {where} LIMIT 1", params).fetchone() is None:
+            return 0
+
+        columns = STORED_COLUMNS
+        with self._transaction() as conn:
+            df = pd.DataFrame(
+                conn.execute(f"SELECT {', '.join(columns)} FROM {SUBMISSIONS_TABLE} WHERE {where} ORDER BY rowid",
+                             params).fetchall(),
+                columns=columns,
+                dtype=object
+            )
+            # Archives are written before the rows are deleted; if the delete
+            # does not commit, the next run archives the rows again and the
+            # copies merge by ID
+            for month, rows in df.groupby(df['timestamp'].map(partition_month)):
+                self._append_archive(month, rows)
+            conn.executemany(
+                f"DELETE FROM {SUBMISSIONS_TABLE} WHERE {ID_COLUMN} = ?", [(value,) for value in df[ID_COLUMN]]
+            )
+            _touch_partitions(conn, df['timestamp'])
+            _log_events(conn, "archive", [(value, None) for value in df[ID_COLUMN]])
+        return len(df)
+
+    def _archive_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"{month}.csv.gz")
+
+    def _append_archive(self, month: str, rows: pd.DataFrame) -> None:
+        path = self._archive_path(month)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with file_lock(path):
+            merged = pd.concat([read_submissions_csv(path), rows], ignore_index=True)
+            merged = merged.drop_duplicates(ID_COLUMN, keep="last")
+            with atomic_write(path, "wb") as f:
+                merged.to_csv(f, index=False, compression="gzip")
+
+    def archive_months(self) -> List[str]:
+        """Months that have a cold archive, oldest first"""
+        return sorted(
+            os.path.basename(path)[:-len(".csv.gz")] for path in glob.glob(os.path.join(self.archive_dir, "*.csv.gz"))
+        )
+
+    def load_archived(self, deleted: Optional[bool] = None, start_date=None, end_date=None) -> pd.DataFrame:
+        """Load archived rows, optionally only active or deleted ones and a submission date range
+
+        Only the archives for months overlapping the range are read. Rows
+        keep their ``deleted_at`` so the two kinds can be told apart.
+        """
+        frames = [
+            read_submissions_csv(self._archive_path(month))
+            for month in self.archive_months() if _month_in_range(month, start_date, end_date)
+        ]
+        if not frames:
+            return pd.DataFrame(columns=STORED_COLUMNS)
+        df = pd.concat(frames, ignore_index=True)
+        df = df.mask(df == "")
+        if deleted is not None:
+            df = df[df[DELETED_AT_COLUMN].notna() == deleted]
+        if start_date:
+            df = df[df['timestamp'].str[:10] >= str(start_date)]
+        if end_date:
+            df = df[df['timestamp'].str[:10] <= str(end_date)]
+        df.index = pd.Index(df[ID_COLUMN].tolist())
+        return df
+
+    # Migration
+
+    def migrate_from_csv(self, submissions_csv: str, deleted_csv: str,
+                         log_file: Optional[str] = None, backup_dir: Optional[str] = None) -> int:
+        """One-shot import of the legacy CSV files into the database
+
+        Current submissions (including entries still pending in the
+        append-only log) are imported as active rows and deleted entries as
+        tombstoned rows. Rows that only survive in ``backups/*.csv`` were
+        lost from the live files at some point, so they are imported as
+        deleted entries where an admin can review and restore them.
+        Returns the number of rows imported.
+        """
+        # Called on every rerun, so the usual already-imported case is a
+        # plain read that never waits for the write lock
+        if self._get_meta(self._connect(), "legacy_csv_imported"):
+            return 0
+
+        active = _read_legacy_csv(submissions_csv)
+        if log_file:
+            active += _read_legacy_log(log_file)
+        deleted = _read_legacy_csv(deleted_csv)
+
+        seen = {_row_key(row) for row in active + deleted}
+        recovered = []
+        if backup_dir:
+            for backup_file in sorted(glob.glob(os.path.join(backup_dir, "*.csv"))):
+                for row in _read_legacy_csv(backup_file):
+                    key = _row_key(row)
+                    if key not in seen:
+                        seen.add(key)
+                        recovered.append(row)
+
+        columns = STORED_COLUMNS
+        placeholders = ", ".join("?" for _ in columns)
+        imported_at = _now()
+        with self._transaction() as conn:
+            # Re-check inside the write lock in case another process migrated first
+            if self._get_meta(conn, "legacy_csv_imported"):
+                return 0
+            for rows, deleted_at in ((active, None), (deleted + recovered, imported_at)):
+                for row in rows:
+                    row['programme_mask'] = _programme_mask(conn, row.get('programme'))
+                values = [
+                    (_id_for_timestamp(row.get('timestamp')),)
+                    + tuple(_sql_value(row.get(col)) for col in SUBMISSION_COLUMNS) + (deleted_at,)
+                    for row in rows
+                ]
+                conn.executemany(
+                    f"INSERT INTO {SUBMISSIONS_TABLE} ({', '.join(columns)}) VALUES ({placeholders})", values
+                )
+                _touch_partitions(conn, [row.get('timestamp') for row in rows])
+                _log_events(conn, "insert", [(value[0], dict(zip(STORED_COLUMNS, value))) for value in values])
+            self._set_meta(conn, "legacy_csv_imported", imported_at)
+        return len(active) + len(deleted) + len(recovered)
+
+
+def _read_manifest(path: str) -> Dict:
+    """Partition manifest, or an empty one if it is missing or from another layout"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get("schema_version") != SCHEMA_VERSION:
+        manifest = {"schema_version": SCHEMA_VERSION, "partitions": {}}
+    return manifest
+
+
+def _read_legacy_csv(path: str) -> List[Dict]:
+    return [split_comment_fields(row) for row in read_submissions_csv(path)[SUBMISSION_COLUMNS].to_dict("records")]
+
+
+def _read_legacy_log(path: str) -> List[Dict]:
+    """Read the JSON-lines submission log used before the database existed"""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line means the process died mid-append; skip it
+                continue
+            entry = with_defaults(split_comment_fields(entry))
+            rows.append({col: entry.get(col) for col in SUBMISSION_COLUMNS})
+    return rows
+
+
+def _row_key(row: Dict) -> tuple:
+    """Content key used to de-duplicate rows found in several legacy files"""
+    return tuple("" if _sql_value(row.get(col)) is None else str(row.get(col)) for col in SUBMISSION_COLUMNS)
+
+
+_stores: Dict[str, SubmissionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(db_path: str) -> SubmissionStore:
+    """Return the process-wide store for ``db_path``
+
+    Streamlit re-executes the app script on every interaction, but imported
+    modules persist, so sessions share one store per database file.
+    """
+    db_path = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = SubmissionStore(db_path)
+            _stores[db_path] = store
+        return store
@@ -0,0 +1,184 @@
+"""Background transcoding of feedback recordings to mono Opus
+
+Browsers upload whatever their MediaRecorder produces (webm, ogg, mp4 or
+wav at full stereo bitrate). A scheduler thread per process looks for
+submissions whose recording has no duration yet, and transcodes them with
+ffmpeg on a process pool: leading and trailing silence is trimmed and the
+audio is re-encoded as speech-tuned mono Opus in an Ogg container. The
+submission is then pointed at the new file together with its duration,
+and the original is removed. Without ffmpeg on the PATH the scheduler is
+not started and recordings are kept as uploaded.
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from audio_store import open_audio_index
+from safe_io import file_lock
+from storage import SubmissionStore
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+TARGET_EXT = ".ogg"
+OPUS_BITRATE = "24k"
+
+# Audio quieter than this counts as silence; a little of it is kept at each end
+SILENCE_THRESHOLD = "-50dB"
+SILENCE_KEEP_SECONDS = 0.2
+
+# Seconds allowed for one recording before ffmpeg is given up on
+TRANSCODE_TIMEOUT = 120
+
+# Skipped recordings are tried once more after this long, in case the failure was transient
+SKIP_RETRY = timedelta(days=1)
+
+
+def _silence_filter() -> str:
+    trim = (
+        f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}"
+        f":start_silence={SILENCE_KEEP_SECONDS}"
+    )
+    # silenceremove only trims the start reliably, so the end is trimmed reversed
+    return f"{trim},areverse,{trim},areverse"
+
+
+def probe_duration_ms(path: str) -> int:
+    """Length of an audio file in milliseconds, as reported by ffprobe"""
+    result = subprocess.run(
+        [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        check=True, capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT,
+    )
+    output = result.stdout.strip()
+    return int(round(float(output) * 1000)) if output and output != "N/A" else 0
+
+
+def transcode_recording(path: str) -> Tuple[str, int]:
+    """Trim and re-encode one recording, returning ``(new_path, duration_ms)``
+
+    Runs in a worker process. The output is written next to the source
+    under a temporary name and moved into place, so a source that is
+    already ``.ogg`` is replaced in one step.
+    """
+    new_path = os.path.splitext(path)[0] + TARGET_EXT
+    directory, name = os.path.split(new_path)
+    tmp_path = os.path.join(directory, f".{name}.tmp{TARGET_EXT}")
+    try:
+        subprocess.run(
+            [FFMPEG, "-nostdin", "-v", "error", "-y", "-i", path,
+             "-af", _silence_filter(), "-ac", "1",
+             "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip",
+             tmp_path],
+            check=True, capture_output=True, timeout=TRANSCODE_TIMEOUT,
+        )
+        duration_ms = probe_duration_ms(tmp_path)
+        os.chmod(tmp_path, 0o666)
+        os.replace(tmp_path, new_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return new_path, duration_ms
+
+
+class TranscodeScheduler:
+    """Background thread that transcodes new recordings on a process pool
+
+    Every ``interval`` seconds the store is asked for rows whose recording
+    has no duration yet. A lock file in the audio directory makes sure
+    only one process works through them at a time, so two processes never
+    transcode the same file. Recordings that are missing or fail are
+    marked in the store, so no process polls for them again until
+    ``SKIP_RETRY`` has passed.
+    """
+
+    def __init__(self, store: SubmissionStore, audio_dir: str, interval: float, workers: int):
+        self.store = store
+        self.audio_dir = audio_dir
+        self.interval = interval
+        self.workers = workers
+        self.last_error: Optional[Exception] = None
+        self._pool = self._new_pool()
+        self._thread = threading.Thread(target=self._run, name="audio-transcoder", daemon=True)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Forked workers would inherit every Streamlit thread; start clean ones
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def run_once(self) -> int:
+        """Transcode every pending recording, returning how many were converted"""
+        index = open_audio_index(self.audio_dir)
+        with file_lock(os.path.join(self.audio_dir, ".transcode")):
+            retry_before = (datetime.now() - SKIP_RETRY).isoformat(timespec="seconds")
+            pending = []
+            for submission_id, path in self.store.untranscoded_audio(retry_before):
+                # The index can lag files written by other processes; check before giving up
+                if index.contains(path) or os.path.exists(path):
+                    pending.append((submission_id, path))
+                else:
+                    self.store.skip_audio(submission_id, path, "missing")
+            futures = [(submission_id, path, self._pool.submit(transcode_recording, path))
+                       for submission_id, path in pending]
+            converted = 0
+            for submission_id, path, future in futures:
+                try:
+                    new_path, duration_ms = future.result()
+                except BrokenProcessPool:
+                    # A worker died; the recording is retried on the next tick with a new pool
+                    self._pool.shutdown(wait=False)
+                    self._pool = self._new_pool()
+                    raise
+                except (OSError, ValueError, subprocess.SubprocessError) as e:
+                    self.store.skip_audio(submission_id, path, f"{type(e).__name__}: {e}")
+                    self.last_error = e
+                    continue
+                if self.store.update_audio(submission_id, path, new_path, duration_ms):
+                    index.add(new_path)
+                    if new_path != path:
+                        index.remove(path)
+                    converted += 1
+                elif new_path != path:
+                    # The row moved on to another recording (or was purged) meanwhile
+                    index.remove(new_path)
+        return converted
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                # Keep the thread alive; the next tick tries again
+                self.last_error = e
+
+
+_transcoders: Dict[str, TranscodeScheduler] = {}
+_transcoders_lock = threading.Lock()
+
+
+def start_transcoder(store: SubmissionStore, audio_dir: str, interval: float,
+                     workers: int) -> Optional[TranscodeScheduler]:
+    """Start the process-wide transcoder for ``audio_dir``, or None without ffmpeg
+
+    Safe to call on every script rerun, like ``backups.start_backup_scheduler``.
+    """
+    if FFMPEG is None or FFPROBE is None:
+        return None
+    key = os.path.abspath(audio_dir)
+    with _transcoders_lock:
+        transcoder = _transcoders.get(key)
+        if transcoder is None:
+            os.makedirs(audio_dir, exist_ok=True)
+            transcoder = TranscodeScheduler(store, audio_dir, interval, workers)
+            transcoder.start()
+            _transcoders[key] = transcoder
+        return transcoder